@@ -19,11 +19,14 @@ import pyHydroEvalUtils
 #import compileNamelist
 #from mpi4py import MPI
 import snAnalysisMod
+import inventoryMod
 
 # Establish MPI objects
 #comm = MPI.COMM_WORLD
 #size = comm.Get_size()
 #rank = comm.Get_rank()
+# Without MPI, reads are ran as a single process. Reads may be split across
+# local processes with --nProcs.
 size = 1
 rank = 0
 
@@ -36,10 +39,19 @@ def main(argv):
     parser.add_argument('--begADate',nargs='?', help='Beginning Date for Analysis/Read in YYYYMMDDHH Format')
     parser.add_argument('--endADate',nargs='?', help='Ending Date for Analysis/Read in YYYYMMDDHH Format') 
     parser.add_argument('--inFile',nargs='?', help='Input file necessary for reading/analysis. Can either be model reads, or observation point file')
-    parser.add_argument('--snRead',nargs='?', help='Read flag for snow analysis and observations (1-4)')
+    parser.add_argument('--snRead',nargs='?', help='Read flag for snow analysis and observations (1-8)')
     parser.add_argument('--snRun',nargs='?', help='Snow analysis flag (1-6)')
     parser.add_argument('--bsnMskFile',nargs='?', help='Optional basin/region R mask file used for reading/analysis.')
     parser.add_argument('--bsnSubFile',nargs='?', help='CSV text file listing subset of basins/regions to read/process')
+    parser.add_argument('--ptEngine',nargs='?', help='Optional flag (1) to use the single-pass point extraction engine for snRead 1-2')
+    parser.add_argument('--bsnIndex',nargs='?', help='Optional flag (1) to aggregate all basins from one read of each file using a compiled basin index for snRead 5-6')
+    parser.add_argument('--bsnRunoff',nargs='?', help='Optional flag (1) to also aggregate model surface/underground runoff for snRead 5-6')
+    parser.add_argument('--elevBand',nargs='?', help='Optional elevation band width (meters) for snRead 8 basin elevation band reads (default 250)')
+    parser.add_argument('--ptCube',nargs='?', help='Optional flag (1) to write snRead 1-2 output as a NetCDF station/day/product cube')
+    parser.add_argument('--modOutHours',nargs='?', help='Optional model output frequency (hours) for sub-daily output aggregated to daily mean/min/max')
+    parser.add_argument('--append',nargs='?', help='Optional flag (1) to extend an existing snRead 1-6 or 8 product for the job with only new days. The existing product is kept.')
+    parser.add_argument('--nProcs',nargs='?', help='Optional number of local processes to split snow reads (1-6) across, by model tag/day range for point reads (1-4) and by basin pixel count for basin reads (5-6)')
+    parser.add_argument('--ckptMinutes',nargs='?', help='Optional interval (minutes) between checkpoints written during snow reads (1-6), used to resume interrupted reads')
       
     args = parser.parse_args()
 
@@ -90,6 +102,15 @@ def main(argv):
         print "ERROR: Unable to create job name subdirectory."
         sys.exit(1)
     
+    # Refresh model output inventories and report any coverage gaps
+    # before reading.
+    if args.snRead:
+        try:
+            inventoryMod.reportGaps(args,db,begADateObj,endADateObj)
+        except:
+            print "ERROR: Unable to update model output inventories."
+            sys.exit(1)
+
     # Run snow reading functions if desired by user.
     if args.snRead:
 	snAnalysisMod.readSnow(args,db,begADateObj,endADateObj,size,rank)
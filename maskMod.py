@@ -0,0 +1,69 @@
+# Program to compile a basin mask for a model project from a gridded basin
+# ID field (Fulldom basn_msk, or basin IDs rasterized from a shapefile).
+# The compiled mask is stored in sparse form in the project geo/masks
+# directory, and can be passed to evalMod.py with --bsnMskFile.
+
+# Logan Karsten
+# National Center for Atmospheric Research
+# Research Applications Laboratory
+
+import sys
+import os
+import argparse
+
+sys.path.insert(0, './python')
+
+import setupMod
+import pyHydroEvalUtils
+
+def main(argv):
+    # Parse arguments passed in.
+    parser = argparse.ArgumentParser(description='Program to compile a basin mask for a model project')
+    parser.add_argument('alias', metavar='alias', type=str, nargs=1,
+                        help='model project alias')
+    parser.add_argument('gridFile', metavar='gridFile', type=str, nargs=1,
+                        help='NetCDF file holding gridded basin IDs')
+    parser.add_argument('--gridVar', nargs='?', help='Basin ID variable name (default basn_msk)')
+    parser.add_argument('--aggFact', nargs='?', help='Aggregation factor between basin grid and geogrid (default 1)')
+    parser.add_argument('--ns2sn', nargs='?', help='Flag (1) to reverse a N->S basin grid to S->N (default 1)')
+    parser.add_argument('--force', nargs='?', help='Flag (1) to recompile an existing compiled mask')
+
+    args = parser.parse_args()
+
+    gridVar = 'basn_msk'
+    if args.gridVar:
+        gridVar = args.gridVar
+    aggFact = 1
+    if args.aggFact:
+        aggFact = int(args.aggFact)
+        if aggFact < 1:
+            print "ERROR: Aggregation factor must be at least 1."
+            sys.exit(1)
+    ns2sn = 1
+    if args.ns2sn:
+        ns2sn = int(args.ns2sn)
+        if ns2sn != 0 and ns2sn != 1:
+            print "ERROR: ns2sn flag must be 0 or 1."
+            sys.exit(1)
+    forceFlag = 0
+    if args.force == "1":
+        forceFlag = 1
+
+    dbPath = "./parm/modelMeta_db.pkl"
+    if not os.path.isfile(dbPath):
+        print "ERROR: Database: " + dbPath + " not found."
+        sys.exit(1)
+    try:
+        db = pyHydroEvalUtils.readDb(dbPath)
+    except:
+        print "ERROR: Model project database failed to read in."
+        sys.exit(1)
+
+    try:
+        setupMod.compileMask(db,args.alias[0],args.gridFile[0],gridVar,aggFact,ns2sn,forceFlag)
+    except:
+        print "ERROR: Failure to compile basin mask."
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,168 @@
+# Module file for maintaining an inventory of model output and SNODAS
+# files available for each model project. Inventories are stored as CSV
+# files under the project inventory directory, listing the available files
+# along with their dates (YYYYMMDD). The directory modification time is 
+# stored alongside, so the directory is only listed again when files have
+# been added or removed. R read programs consult these inventories instead of checking
+# for each file individually.
+
+# Logan Karsten
+# National Center for Atmospheric Research
+# Research Applications Laboratory
+
+import os
+import datetime
+
+# Establish product file name conventions. Files are named prefix + time
+# stamp + suffix, where the time stamp is YYYYMMDD or YYYYMMDDHHMM. Model
+# output may be daily (00Z only) or sub-daily.
+invProducts = {'LDASOUT':['','.LDASOUT_DOMAIN1'],
+               'SNODAS':['SNODAS_REGRIDDED_','.nc']}
+
+def inventoryPath(dbIn,ind,product):
+    # Return path to the inventory file for a product in a model project.
+    return dbIn.topDir[ind] + "/" + dbIn.alias[ind] + "/inventory/" + \
+           product + "_INVENTORY.csv"
+
+def readInventory(invFile):
+    # Read an inventory file. Returns the directory modification time
+    # recorded when the inventory was built, along with the list of
+    # [file,stamp] entries. Inventories without a file column are treated
+    # as stale.
+    mtime = None
+    entries = []
+    if not os.path.isfile(invFile):
+        return mtime, entries
+    headerFlag = 0
+    with open(invFile,'r') as fileObj:
+        for line in fileObj:
+            line = line.strip()
+            if line.startswith('# mtime:'):
+                mtime = float(line.split(':')[1])
+            elif line == 'file,stamp,date':
+                headerFlag = 1
+            elif len(line) == 0 or line.startswith('#'):
+                continue
+            elif headerFlag == 1:
+                entries.append(line.split(',')[0:2])
+    if headerFlag == 0:
+        return None, []
+    return mtime, entries
+
+def inventoryDates(entries,dailyFlag=1):
+    # Return list of dates (YYYYMMDD) available from inventory entries. If 
+    # dailyFlag is 1, only files valid at 00Z are used.
+    dates = []
+    for entry in entries:
+        stamp = entry[1]
+        if dailyFlag == 1 and len(stamp) == 12 and stamp[8:12] != '0000':
+            continue
+        dates.append(stamp[0:8])
+    return sorted(set(dates))
+
+def updateInventory(invFile,dataDir,product):
+    # Build or refresh the inventory for a product directory. The directory
+    # is only listed if its modification time differs from the one recorded
+    # in the inventory file. Returns list of [file,stamp] entries.
+    prefix = invProducts[product][0]
+    suffix = invProducts[product][1]
+
+    if not os.path.isdir(dataDir):
+        print "WARNING: Directory: " + dataDir + " not found. Unable to build inventory."
+        return []
+
+    mtime = os.stat(dataDir).st_mtime
+    mtimeOld, entries = readInventory(invFile)
+    if mtimeOld is not None and mtimeOld == mtime:
+        return entries
+
+    print 'UPDATING ' + product + ' INVENTORY FOR: ' + dataDir
+    entries = []
+    for fileName in sorted(os.listdir(dataDir)):
+        if not fileName.startswith(prefix) or not fileName.endswith(suffix):
+            continue
+        stamp = fileName[len(prefix):len(fileName)-len(suffix)]
+        if len(stamp) not in [8,12] or not stamp.isdigit():
+            continue
+        entries.append([fileName,stamp])
+
+    # Write to a temporary file first, then rename, so R programs never
+    # read a partially written inventory.
+    invDir = os.path.dirname(invFile)
+    if not os.path.isdir(invDir):
+        try:
+            os.makedirs(invDir)
+        except:
+            print "ERROR: Unable to create inventory directory: " + invDir
+            raise
+    tmpFile = invFile + "." + str(os.getpid()) + ".tmp"
+    try:
+        with open(tmpFile,'w') as fileObj:
+            fileObj.write('# directory:' + dataDir + '\n')
+            fileObj.write('# mtime:' + repr(mtime) + '\n')
+            fileObj.write('file,stamp,date\n')
+            for entry in entries:
+                fileObj.write(entry[0] + ',' + entry[1] + ',' + entry[1][0:8] + '\n')
+        os.rename(tmpFile,invFile)
+    except:
+        print "ERROR: Unable to write inventory file: " + invFile
+        raise
+
+    return entries
+
+def updateProject(dbIn,ind):
+    # Refresh model output and SNODAS inventories for a model project.
+    entriesOut = {}
+    entriesOut['LDASOUT'] = updateInventory(inventoryPath(dbIn,ind,'LDASOUT'),
+                                          dbIn.modelInDir[ind],'LDASOUT')
+    if len(dbIn.snodasPath[ind]) != 0:
+        entriesOut['SNODAS'] = updateInventory(inventoryPath(dbIn,ind,'SNODAS'),
+                                             dbIn.snodasPath[ind],'SNODAS')
+    return entriesOut
+
+def findGaps(dates,begDateObj,endDateObj):
+    # Return list of [begDate,endDate] ranges of days between begDateObj
+    # and endDateObj not present in dates.
+    datesAvail = set(dates)
+    gaps = []
+    dCurrent = datetime.datetime(begDateObj.year,begDateObj.month,begDateObj.day)
+    while dCurrent <= endDateObj:
+        if dCurrent.strftime('%Y%m%d') not in datesAvail:
+            if len(gaps) > 0 and gaps[-1][1] == dCurrent - datetime.timedelta(days=1):
+                gaps[-1][1] = dCurrent
+            else:
+                gaps.append([dCurrent,dCurrent])
+        dCurrent = dCurrent + datetime.timedelta(days=1)
+    return gaps
+
+def reportGaps(args,dbIn,begDateObj,endDateObj):
+    # Refresh inventories for the model projects chosen, and report any
+    # days missing model output (or SNODAS data if needed by the read/analysis
+    # option chosen) between the beginning and ending dates.
+    snodasFlag = 0
+    if args.snRead in ["2","4","6","7","8"]:
+        snodasFlag = 1
+    # Daily model output is only read at 00Z.
+    dailyFlag = 1
+    if args.modOutHours:
+        dailyFlag = 0
+
+    for i in range(0,len(dbIn.alias)):
+        if dbIn.alias[i] not in args.modelProjects:
+            continue
+        entriesOut = updateProject(dbIn,i)
+        products = ['LDASOUT']
+        if snodasFlag == 1 and dbIn.alias[i] == args.modelProjects[0] and 'SNODAS' in entriesOut:
+            products.append('SNODAS')
+        for product in products:
+            gaps = findGaps(inventoryDates(entriesOut[product],dailyFlag),begDateObj,endDateObj)
+            if len(gaps) == 0:
+                print 'COMPLETE ' + product + ' COVERAGE FOR: ' + dbIn.alias[i]
+                continue
+            nMissing = 0
+            for gap in gaps:
+                nMissing = nMissing + (gap[1] - gap[0]).days + 1
+            print "WARNING: " + str(nMissing) + " days of " + product + " output missing for: " + \
+                  dbIn.alias[i]
+            for gap in gaps:
+                print "   " + gap[0].strftime('%Y-%m-%d') + " to " + gap[1].strftime('%Y-%m-%d')
@@ -74,10 +74,74 @@ def checkArgs(parser):
         if int(parser.snRead) == 6 and not parser.bsnMskFile:
             print "ERROR: Mask file necessary for aggregated reads."
             raise
+        if int(parser.snRead) == 8 and not parser.bsnMskFile:
+            print "ERROR: Mask file necessary for aggregated reads."
+            raise
     if parser.bsnSubFile:
         if len(parser.bsnSubFile) == 0:
             print "ERROR: Zero length basin subset file passed to program."
             raise
+    if parser.ptEngine:
+        if int(parser.ptEngine) != 0 and int(parser.ptEngine) != 1:
+            print "ERROR: Point engine flag must be 0 or 1."
+            raise
+        if not parser.snRead or int(parser.snRead) > 2:
+            print "ERROR: Point engine only available for snow read options 1-2."
+            raise
+    if parser.bsnIndex:
+        if int(parser.bsnIndex) != 0 and int(parser.bsnIndex) != 1:
+            print "ERROR: Basin index flag must be 0 or 1."
+            raise
+        if not parser.snRead or (int(parser.snRead) != 5 and int(parser.snRead) != 6):
+            print "ERROR: Basin index only available for snow read options 5-6."
+            raise
+    if parser.bsnRunoff:
+        if int(parser.bsnRunoff) != 0 and int(parser.bsnRunoff) != 1:
+            print "ERROR: Basin runoff flag must be 0 or 1."
+            raise
+        if not parser.snRead or (int(parser.snRead) != 5 and int(parser.snRead) != 6):
+            print "ERROR: Basin runoff only available for snow read options 5-6."
+            raise
+    if parser.elevBand:
+        if float(parser.elevBand) <= 0.0:
+            print "ERROR: Elevation band width must be greater than 0."
+            raise
+        if not parser.snRead or int(parser.snRead) != 8:
+            print "ERROR: Elevation bands only available for snow read option 8."
+            raise
+    if parser.ptCube:
+        if int(parser.ptCube) != 0 and int(parser.ptCube) != 1:
+            print "ERROR: Point cube flag must be 0 or 1."
+            raise
+        if not parser.snRead or int(parser.snRead) > 2:
+            print "ERROR: Point cube output only available for snow read options 1-2."
+            raise
+    if parser.modOutHours:
+        if int(parser.modOutHours) < 1 or int(parser.modOutHours) > 24:
+            print "ERROR: Model output frequency must be between 1 and 24 hours."
+            raise
+        if 24 % int(parser.modOutHours) != 0:
+            print "ERROR: Model output frequency must divide evenly into 24 hours."
+            raise
+    if parser.append:
+        if int(parser.append) != 0 and int(parser.append) != 1:
+            print "ERROR: Append flag must be 0 or 1."
+            raise
+        if not parser.snRead or int(parser.snRead) > 6:
+            print "ERROR: Append mode only available for snow read options 1-6."
+            raise
+    if parser.nProcs:
+        if int(parser.nProcs) < 1:
+            print "ERROR: Number of read processes must be at least 1."
+            raise
+        if int(parser.nProcs) > 1:
+            if not parser.snRead or int(parser.snRead) > 6:
+                print "ERROR: Multiple read processes only available for snow read options 1-6."
+                raise
+    if parser.ckptMinutes:
+        if int(parser.ckptMinutes) < 1:
+            print "ERROR: Checkpoint interval must be at least 1 minute."
+            raise
 
 def checkSNArgs(parser):
     # Check arguments for the snow database extraction program.
@@ -119,6 +183,61 @@ def checkSNArgs(parser):
         if len(parser.mskFile) == 0:
             print "ERROR: Zero length mask file passed to program."
             raise
+    if parser.chunkSize:
+        if int(parser.chunkSize) <= 0:
+            print "ERROR: Streaming chunk size must be greater than zero."
+            raise
+    if parser.cacheDir:
+        if parser.cacheDir == '.' or parser.cacheDir == './':
+            print "ERROR: Please specify full path to observation cache directory."
+            raise
+    if parser.nConn:
+        if int(parser.nConn) < 1:
+            print "ERROR: Number of database connections must be at least one."
+            raise
+        if int(parser.nConn) > 1 and (parser.chunkSize or parser.cacheDir):
+            print "ERROR: Parallel extraction cannot be combined with streaming or cached extraction."
+            raise
+    if parser.shardDays:
+        if int(parser.shardDays) < 1:
+            print "ERROR: Shard length must be at least one day."
+            raise
+    if parser.windows and parser.waterYears:
+        print "ERROR: Please choose either a list of windows or a range of water years."
+        raise
+    if parser.windows or parser.waterYears:
+        if parser.begRDate:
+            print "ERROR: Batch windows cannot be combined with begRDate/endRDate."
+            raise
+        if parser.chunkSize or parser.cacheDir:
+            print "ERROR: Batch windows cannot be combined with streaming or cached extraction."
+            raise
+    elif not parser.begRDate:
+        print "ERROR: Please provide begRDate/endRDate or a list of windows."
+        raise
+    if parser.windows:
+        for windowStr in parser.windows.split(','):
+            if len(windowStr.strip()) != 21:
+                print "ERROR: Window: " + windowStr + " not in YYYYMMDDHH_YYYYMMDDHH format."
+                raise
+    if parser.waterYears:
+        if len(parser.waterYears) != 9:
+            print "ERROR: waterYears not in YYYY-YYYY format."
+            raise
+        if int(parser.waterYears[0:4]) > int(parser.waterYears[5:9]):
+            print "ERROR: Beginning water year must not exceed ending water year."
+            raise
+    if parser.nWorkers:
+        if int(parser.nWorkers) < 1:
+            print "ERROR: Number of worker processes must be at least one."
+            raise
+    if parser.daily:
+        if int(parser.daily) != 0 and int(parser.daily) != 1:
+            print "ERROR: Daily aggregation flag must be 0 or 1."
+            raise
+        if int(parser.daily) == 1 and parser.chunkSize:
+            print "ERROR: Daily aggregation cannot be combined with streaming extraction."
+            raise
             
 def returnDate(dIn):
 	# Convert a date string in YYYYMMDDHH format to a datetime object
@@ -8,6 +8,8 @@ import os
 from ConfigParser import SafeConfigParser
 import pickle
 import shutil
+import inventoryMod
+import subprocess
 
 # Establish class object to hold information on model runs
 class modelDatabase:
@@ -151,6 +153,10 @@ class modelDatabase:
         #statsLink2GagesFile = geoDir1 + "/stats_links_2_gages.txt"
         #plotLink2GagesFile = geoDir1 + "/plot_links_2_gages.txt"
         os.symlink(self.geoFile[ind],geoLsmLnk)
+        # Directory to hold cached station geogrid indices. These are reused
+        # by all point read jobs for this project.
+        geoIndexDir = geoDir1 + "/index_cache"
+        os.mkdir(geoIndexDir)
         #os.symlink(self.fullDomFile[ind],geoHydroLnk)
         #os.symlink(self.mskFile[ind],mskFile)
         #if len(self.statsLink2GageFile[ind]) != 0:
@@ -165,6 +171,12 @@ class modelDatabase:
         #forcDir1 = subDir1 + "/forcing"
         #os.symlink(self.forceInDir[ind],forcDir1)
 
+        # Build inventory of model output and SNODAS files available. These
+        # are refreshed before each read job as new files arrive.
+        invDir = subDir1 + "/inventory"
+        os.mkdir(invDir)
+        inventoryMod.updateProject(self,ind)
+
         # Create output directories to hold analysis/plotting data
         outDir1 = subDir1 + "/analysis_out"
         outDir2 = outDir1 + "/analysis_datasets"
@@ -574,3 +586,53 @@ def copyModelProject(args,aliasIn,aliasNew):
 	# Establish subdirectory within specified output directory 
 	# for model project.
 	modelDatabase.setupProject(db)	
+
+def compileMask(dbIn,aliasIn,gridFile,gridVar='basn_msk',aggFact=1,ns2sn=1,forceFlag=0):
+    """ Compile a sparse basin mask for a model project from a gridded
+        basin ID field (Fulldom basn_msk, or a grid rasterized from a
+        shapefile). Compiled masks are placed in the project geo/masks
+        directory, named by the grid file and aggregation factor, and
+        are reused unless forceFlag is 1. Returns path to the mask file.
+    """
+    
+    aliasInd = -1
+    for i in range(0,len(dbIn.alias)):
+        if dbIn.alias[i] == aliasIn:
+            aliasInd = i
+    if aliasInd < 0:
+        print "ERROR: " + aliasIn + " not found in database."
+        raise
+    if not os.path.isfile(gridFile):
+        print "ERROR: Basin grid file: " + gridFile + " not found."
+        raise
+        
+    mskDir = dbIn.topDir[aliasInd] + "/" + dbIn.alias[aliasInd] + "/geo/masks"
+    if not os.path.isdir(mskDir):
+        try:
+            os.makedirs(mskDir)
+        except:
+            print "ERROR: Unable to create mask directory: " + mskDir
+            raise
+    gridBase = os.path.splitext(os.path.basename(gridFile))[0]
+    mskFile = mskDir + "/BASIN_MASK_" + gridBase + "_" + gridVar + "_AGG" + \
+              str(aggFact) + ".Rdata"
+    
+    if os.path.isfile(mskFile):
+        if forceFlag == 0:
+            print "USING EXISTING COMPILED MASK: " + mskFile
+            return mskFile
+        os.remove(mskFile)
+        
+    cmd = "Rscript ./R/COMPILE_MASKS.R " + dbIn.geoFile[aliasInd] + " " + gridFile + \
+          " " + gridVar + " " + str(aggFact) + " " + str(ns2sn) + " " + mskFile
+    try:
+        subprocess.call(cmd,shell=True)
+    except:
+        print "ERROR: Failure to compile basin mask."
+        raise
+    if not os.path.isfile(mskFile):
+        print "ERROR: Expected compiled mask: " + mskFile + " not found."
+        raise
+    
+    print "COMPILED MASK: " + mskFile
+    return mskFile
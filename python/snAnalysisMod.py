@@ -6,8 +6,15 @@
 # Research Applications Laboratory
 
 import ioMgmntMod
+import inventoryMod
 import subprocess
 import os
+import shutil
+import math
+import multiprocessing
+import glob
+import datetime
+import hashlib
 
 def readSnow(args,dbIn,begDateObj,endDateObj,size,rank):
     # Top level module to read in either point analysis/model, aggregated
@@ -51,6 +58,17 @@ def readSnow(args,dbIn,begDateObj,endDateObj,size,rank):
             pathListStr = pathListStr + "'" + modPaths[i] + "', "
     pathListStr = "modPaths <- " + pathListStr + "\n"
             
+    # Compose model output inventory file list. SNODAS inventory is taken
+    # from the primary model project.
+    invListStr = "c("
+    for i in range(0, numModIn):
+        if i == (numModIn - 1):
+            invListStr = invListStr + "'" + inventoryMod.inventoryPath(dbIn,tagInds[i],'LDASOUT') + "')"
+        else:
+            invListStr = invListStr + "'" + inventoryMod.inventoryPath(dbIn,tagInds[i],'LDASOUT') + "', "
+    invListStr = "modInvFiles <- " + invListStr + "\n"
+    snodasInvStr = "snodasInvFile <- '" + inventoryMod.inventoryPath(dbIn,indDbOrig,'SNODAS') + "'\n"
+            
     # Compose datetime strings
     begDateStr = "dateStart <- as.POSIXct('" + begDateObj.strftime('%Y-%m-%d %H') + \
                  ":00', format='%Y-%m-%d %H:%M', tz='UTC')\n" 
@@ -61,12 +79,20 @@ def readSnow(args,dbIn,begDateObj,endDateObj,size,rank):
     jobDir = dbIn.topDir[indDbOrig] + "/" + dbIn.alias[indDbOrig] + "/" + args.jobName
     jobDirStr = "jobDir <- '" + jobDir + "'\n"
         
-    # Establish path to SNODAS data
+    # Establish path to SNODAS data, along with the SNODAS cache shared by
+    # all model projects reading this SNODAS directory. Cached values are
+    # keyed under an md5 hash of the SNODAS path.
     if len(dbIn.snodasPath[indDbOrig]) != 0:
-        snodasStr = "snodasPath <- '" + dbIn.snodasPath[indDbOrig] + "'\n"
+        snodasHash = hashlib.md5(os.path.realpath(dbIn.snodasPath[indDbOrig])).hexdigest()
+        snodasStr = "snodasPath <- '" + dbIn.snodasPath[indDbOrig] + "'\n" + \
+                    "snodasCacheDir <- '" + dbIn.topDir[indDbOrig] + "/snodas_cache/" + \
+                    snodasHash + "'\n"
         
-    # Establish path to geogrid file
+    # Establish path to geogrid file, along with the project geogrid index 
+    # cache used to hold station grid coordinates.
     geoStr = "geoFile <- '" + dbIn.geoFile[indDbOrig] + "'\n"
+    geoIndexStr = "geoIndexDir <- '" + dbIn.topDir[indDbOrig] + "/" + dbIn.alias[indDbOrig] + \
+                  "/geo/index_cache'\n"
         
     # Compose strings conveying MPI size/rank information
     sizeStr = "size <- " + str(size) + "\n"
@@ -91,14 +117,24 @@ def readSnow(args,dbIn,begDateObj,endDateObj,size,rank):
         ioMgmntMod.writeStrToFile(tmpRFile,sizeStr)
         ioMgmntMod.writeStrToFile(tmpRFile,rankStr)
         ioMgmntMod.writeStrToFile(tmpRFile,geoStr)
+        ioMgmntMod.writeStrToFile(tmpRFile,geoIndexStr)
+        ioMgmntMod.writeStrToFile(tmpRFile,invListStr)
+        ioMgmntMod.writeStrToFile(tmpRFile,snodasInvStr)
+        if args.modOutHours:
+            ioMgmntMod.writeStrToFile(tmpRFile,"modOutHours <- " + args.modOutHours + "\n")
+        if args.ckptMinutes:
+            ioMgmntMod.writeStrToFile(tmpRFile,"ckptMinutes <- " + args.ckptMinutes + "\n")
     except:
         print("ERROR: Unable to write basic R information to temporary file.")
         raise
         
     # Situation #1 - Read in model snow fields at points given observations file.
     if args.snRead == "1":
-        outFile = "outFile <- '" + jobDir + "/SN_PT_MOD_" + begDateObj.strftime('%Y%m%d%H') + \
-                  "_" + endDateObj.strftime('%Y%m%d%H') + ".Rdata'\n"
+        outPath = jobDir + "/SN_PT_MOD_" + begDateObj.strftime('%Y%m%d%H') + \
+                  "_" + endDateObj.strftime('%Y%m%d%H') + ".Rdata"
+        if args.ptCube == "1":
+            outPath = outPath[:-6] + ".nc"
+        outFile = "outFile <- '" + outPath + "'\n"
         obsStr = "ptObsFile <- '" + args.inFile + "'\n"
         try:
             ioMgmntMod.writeStrToFile(tmpRFile,obsStr)
@@ -107,17 +143,18 @@ def readSnow(args,dbIn,begDateObj,endDateObj,size,rank):
             print "ERROR: Unable to write to temporary R file."
             raise
             
-        cmd = "Rscript ./R/SNOW_POINT_READ.R " + tmpRFile
-        try:
-            subprocess.call(cmd,shell=True)
-        except:
-            print "ERROR: Failure to execute snow reads"
-            raise
+        rScript = "./R/SNOW_POINT_READ.R"
+        if args.ptEngine == "1":
+            rScript = "./R/SNOW_POINT_ENGINE.R"
+        runSnowRead(args,rScript,tmpRFile,outPath,range(1,numModIn+1),'station',begDateObj,endDateObj)
         
     # Situation #2 - Read in model + SNODAS fields at points given observations file.
     if args.snRead == "2":
-        outFile = "outFile <- '" + jobDir + "/SN_PT_MOD_SNODAS_" + begDateObj.strftime('%Y%m%d%H') + \
-                  "_" + endDateObj.strftime('%Y%m%d%H') + ".Rdata'\n"
+        outPath = jobDir + "/SN_PT_MOD_SNODAS_" + begDateObj.strftime('%Y%m%d%H') + \
+                  "_" + endDateObj.strftime('%Y%m%d%H') + ".Rdata"
+        if args.ptCube == "1":
+            outPath = outPath[:-6] + ".nc"
+        outFile = "outFile <- '" + outPath + "'\n"
         obsStr = "ptObsFile <- '" + args.inFile + "'\n"
         if len(dbIn.snodasPath[indDbOrig]) == 0:
             print "ERROR: Path to SNODAS data necessary for reads."
@@ -125,22 +162,22 @@ def readSnow(args,dbIn,begDateObj,endDateObj,size,rank):
         try:
             ioMgmntMod.writeStrToFile(tmpRFile,obsStr)
             ioMgmntMod.writeStrToFile(tmpRFile,snodasStr)
+            ioMgmntMod.writeStrToFile(tmpRFile,"snodasFlag <- 1\n")
             ioMgmntMod.writeStrToFile(tmpRFile,outFile)
         except:
             print "ERROR: Unable to write to temporary R file."
             raise
             
-        cmd = "Rscript ./R/SNOW_POINT_READ_SNODAS.R " + tmpRFile
-        try:
-            subprocess.call(cmd,shell=True)
-        except:
-            print "ERROR: Failure to execute snow reads"
-            raise
+        rScript = "./R/SNOW_POINT_READ_SNODAS.R"
+        if args.ptEngine == "1":
+            rScript = "./R/SNOW_POINT_ENGINE.R"
+        runSnowRead(args,rScript,tmpRFile,outPath,range(0,numModIn+1),'station',begDateObj,endDateObj)
         
     # Situation #3 - Read in model snow fields aggregated to basins plus point obs.
     if args.snRead == "3":
-        outFile = "outFile <- '" + jobDir + "/SN_PTBAS_MOD_" + begDateObj.strftime('%Y%m%d%H') + \
-                  "_" + endDateObj.strftime('%Y%m%d%H') + ".Rdata'\n"
+        outPath = jobDir + "/SN_PTBAS_MOD_" + begDateObj.strftime('%Y%m%d%H') + \
+                  "_" + endDateObj.strftime('%Y%m%d%H') + ".Rdata"
+        outFile = "outFile <- '" + outPath + "'\n"
         obsStr = "ptObsFile <- '" + args.inFile + "'\n"
         bsnMskStr = "bsnMskFile <- '" + args.bsnMskFile + "'\n"
         try:
@@ -151,17 +188,14 @@ def readSnow(args,dbIn,begDateObj,endDateObj,size,rank):
             print "ERROR: Unable to write to temporary R file."
             raise
             
-        cmd = "Rscript ./R/SNOW_BASIN_POINT_READ.R " + tmpRFile
-        try:
-            subprocess.call(cmd,shell=True)
-        except:
-            print "ERROR: Failure to execute snow reads"
-            raise
+        rScript = "./R/SNOW_BASIN_POINT_READ.R"
+        runSnowRead(args,rScript,tmpRFile,outPath,range(1,numModIn+1),'station',begDateObj,endDateObj)
             
     # Situation #4 - Read in model + SNODAS fields aggregated to basins plus point obs.
     if args.snRead == "4":
-        outFile = "outFile <- '" + jobDir + "/SN_PTBAS_MOD_SNODAS_" + begDateObj.strftime('%Y%m%d%H') + \
-                  "_" + endDateObj.strftime('%Y%m%d%H') + ".Rdata'\n"
+        outPath = jobDir + "/SN_PTBAS_MOD_SNODAS_" + begDateObj.strftime('%Y%m%d%H') + \
+                  "_" + endDateObj.strftime('%Y%m%d%H') + ".Rdata"
+        outFile = "outFile <- '" + outPath + "'\n"
         obsStr = "ptObsFile <- '" + args.inFile + "'\n"
         if len(dbIn.snodasPath[indDbOrig]) == 0:
             print "ERROR: Path to SNODAS data necessary for reads."
@@ -176,37 +210,34 @@ def readSnow(args,dbIn,begDateObj,endDateObj,size,rank):
             print "ERROR: Unable to write to temporary R file."
             raise
             
-        cmd = "Rscript ./R/SNOW_BASIN_POINT_READ_SNODAS.R " + tmpRFile
-        try:
-            subprocess.call(cmd,shell=True)
-        except:
-            print "ERROR: Failure to execute snow reads"
-            raise
+        rScript = "./R/SNOW_BASIN_POINT_READ_SNODAS.R"
+        runSnowRead(args,rScript,tmpRFile,outPath,range(0,numModIn+1),'row',begDateObj,endDateObj)
             
     # Situation #5 - Read in model snow fields aggregated to basins.
     if args.snRead == "5":
-        outFile = "outFile <- '" + jobDir + "/SN_BAS_MOD_" + begDateObj.strftime('%Y%m%d%H') + \
-                  "_" + endDateObj.strftime('%Y%m%d%H') + ".Rdata'\n"
+        outPath = jobDir + "/SN_BAS_MOD_" + begDateObj.strftime('%Y%m%d%H') + \
+                  "_" + endDateObj.strftime('%Y%m%d%H') + ".Rdata"
+        outFile = "outFile <- '" + outPath + "'\n"
         bsnMskStr = "bsnMskFile <- '" + args.bsnMskFile + "'\n"
         try:
             ioMgmntMod.writeStrToFile(tmpRFile,bsnMskStr)
+            if args.bsnRunoff == "1":
+                ioMgmntMod.writeStrToFile(tmpRFile,"bsnRunoff <- 1\n")
             ioMgmntMod.writeStrToFile(tmpRFile,outFile)
         except:
             print "ERROR: Unable to write to temporary R file."
             raise
             
-        cmd = "Rscript ./R/SNOW_BASIN_READ.R " + tmpRFile
-        print cmd
-        try:
-            subprocess.call(cmd,shell=True)
-        except:
-            print "ERROR: Failure to execute snow reads"
-            raise
+        rScript = "./R/SNOW_BASIN_READ.R"
+        if args.bsnIndex == "1":
+            rScript = "./R/SNOW_BASIN_INDEX_READ.R"
+        runSnowRead(args,rScript,tmpRFile,outPath,range(1,numModIn+1),'none',begDateObj,endDateObj)
         
     # Situation #6 - Read in mode + SNODAS fields aggregated to basins. 
     if args.snRead == "6":
-        outFile = "outFile <- '" + jobDir + "/SN_BAS_MOD_SNODAS_" + begDateObj.strftime('%Y%m%d%H') + \
-                  "_" + endDateObj.strftime('%Y%m%d%H') + ".Rdata'\n"
+        outPath = jobDir + "/SN_BAS_MOD_SNODAS_" + begDateObj.strftime('%Y%m%d%H') + \
+                  "_" + endDateObj.strftime('%Y%m%d%H') + ".Rdata"
+        outFile = "outFile <- '" + outPath + "'\n"
         if len(dbIn.snodasPath[indDbOrig]) == 0:
             print "ERROR: Path to SNODAS data necessary for reads."
             raise
@@ -214,17 +245,18 @@ def readSnow(args,dbIn,begDateObj,endDateObj,size,rank):
         try:
             ioMgmntMod.writeStrToFile(tmpRFile,bsnMskStr)
             ioMgmntMod.writeStrToFile(tmpRFile,snodasStr)
+            ioMgmntMod.writeStrToFile(tmpRFile,"snodasFlag <- 1\n")
+            if args.bsnRunoff == "1":
+                ioMgmntMod.writeStrToFile(tmpRFile,"bsnRunoff <- 1\n")
             ioMgmntMod.writeStrToFile(tmpRFile,outFile)
         except:
             print "ERROR: Unable to write to temporary R file."
             raise
             
-        cmd = "Rscript ./R/SNOW_BASIN_READ_SNODAS.R " + tmpRFile
-        try:
-            subprocess.call(cmd,shell=True)
-        except:
-            print "ERROR: Failure to execute snow reads"
-            raise
+        rScript = "./R/SNOW_BASIN_READ_SNODAS.R"
+        if args.bsnIndex == "1":
+            rScript = "./R/SNOW_BASIN_INDEX_READ.R"
+        runSnowRead(args,rScript,tmpRFile,outPath,range(0,numModIn+1),'none',begDateObj,endDateObj)
             
     # Situation #7 - Generate spatial analysis NetCDF/Tif files from model(s)
     # against SNODAS.
@@ -245,6 +277,30 @@ def readSnow(args,dbIn,begDateObj,endDateObj,size,rank):
             print "ERROR: Failure to execute snow reads"
             raise
             
+    # Situation #8 - Read in model (+ SNODAS if available) snow fields 
+    # aggregated to elevation bands within basins.
+    if args.snRead == "8":
+        outPath = jobDir + "/SN_BAS_ELEV_" + begDateObj.strftime('%Y%m%d%H') + \
+                  "_" + endDateObj.strftime('%Y%m%d%H') + ".Rdata"
+        outFile = "outFile <- '" + outPath + "'\n"
+        bsnMskStr = "bsnMskFile <- '" + args.bsnMskFile + "'\n"
+        products = range(1,numModIn+1)
+        try:
+            ioMgmntMod.writeStrToFile(tmpRFile,bsnMskStr)
+            if len(dbIn.snodasPath[indDbOrig]) != 0:
+                ioMgmntMod.writeStrToFile(tmpRFile,snodasStr)
+                ioMgmntMod.writeStrToFile(tmpRFile,"snodasFlag <- 1\n")
+                products = range(0,numModIn+1)
+            if args.elevBand:
+                ioMgmntMod.writeStrToFile(tmpRFile,"elevBand <- " + args.elevBand + "\n")
+            ioMgmntMod.writeStrToFile(tmpRFile,outFile)
+        except:
+            print "ERROR: Unable to write to temporary R file."
+            raise
+            
+        rScript = "./R/SNOW_BASIN_ELEV_READ.R"
+        runSnowRead(args,rScript,tmpRFile,outPath,products,'none',begDateObj,endDateObj)
+            
     print tmpRFile
     # Remove temporary R namelist file
     #try:
@@ -362,4 +418,268 @@ def runSnow(args,dbIn,begDateObj,endDateObj,size,rank):
             subprocess.call(cmd,shell=True)
         except:
             print "ERROR: Failure to execute snow analysis job"
-            raise
\ No newline at end of file
+            raise
+    
+def runSnowRead(args,rScript,tmpRFile,outPath,products,naOmit,begDateObj,endDateObj,appendCheck=1):
+    # Function to execute an R snow read program. If more than one process
+    # has been requested, reads are split into shards by product (0 for SNODAS,
+    # 1-N for model tags) and day range. Each shard is ran as a separate R
+    # process, with partial tables merged deterministically into outPath.
+    # In append mode, an existing product for the job covering the beginning
+    # of the period is extended with only the new days.
+    if args.append == "1" and appendCheck == 1:
+        existPath, existEndObj = findExistingRead(outPath,endDateObj)
+        if existPath is not None:
+            appendRead(args,rScript,tmpRFile,outPath,products,naOmit,begDateObj,
+                       endDateObj,existPath,existEndObj)
+            return
+            
+    nProcs = 1
+    if args.nProcs:
+        nProcs = int(args.nProcs)
+        
+    if nProcs == 1:
+        cmd = "Rscript " + rScript + " " + tmpRFile
+        try:
+            retCode = subprocess.call(cmd,shell=True)
+        except:
+            print "ERROR: Failure to execute snow reads"
+            raise
+        if retCode != 0:
+            print "ERROR: Snow read program exited with code: " + str(retCode)
+            raise
+        return
+        
+    # Compose shards and their temporary R namelist files. Shard namelists 
+    # are copies of the main namelist with shard information appended.
+    # Basin reads are split by region, balanced by region pixel count (see
+    # mpiLandRegions in UTILS.R), with each process reading all days and
+    # products for its regions. Point reads are split by product and day
+    # range.
+    shardStrs = []
+    regionFlag = 0
+    if naOmit == 'none':
+        regionFlag = 1
+        for i in range(0,nProcs):
+            shardStrs.append(["size <- " + str(nProcs) + "\n","rank <- " + str(i) + "\n"])
+    else:
+        nDays = int((endDateObj - begDateObj).total_seconds()/86400.0)
+        for shard in buildReadShards(products,nDays,nProcs):
+            shardStrs.append(["shardFlag <- 1\n",
+                              "shardDays <- c(" + str(shard[0]) + "," + str(shard[1]) + ")\n",
+                              "shardProducts <- c(" + str(shard[2]) + ")\n"])
+    shardFiles = []
+    shardRFiles = []
+    cmds = []
+    for i in range(0,len(shardStrs)):
+        shardRFile = tmpRFile[:-2] + "_SHARD_" + str(i) + ".R"
+        shardOut = os.path.splitext(outPath)[0] + "_SHARD_" + str(i) + ".Rdata"
+        # Shard files left behind by a failed run are stale, and would stop
+        # the shard read or be merged in its place.
+        for tmpFile in [shardRFile,shardOut]:
+            if os.path.isfile(tmpFile):
+                print "WARNING: Removing stale shard file: " + tmpFile
+                try:
+                    os.remove(tmpFile)
+                except:
+                    print "ERROR: Failure to remove stale shard file: " + tmpFile
+                    raise
+        try:
+            shutil.copy(tmpRFile,shardRFile)
+            for shardStr in shardStrs[i]:
+                ioMgmntMod.writeStrToFile(shardRFile,shardStr)
+            ioMgmntMod.writeStrToFile(shardRFile,"outFile <- '" + shardOut + "'\n")
+        except:
+            print "ERROR: Unable to create shard R namelist file: " + shardRFile
+            raise
+        shardRFiles.append(shardRFile)
+        shardFiles.append(shardOut)
+        cmds.append("Rscript " + rScript + " " + shardRFile)
+        
+    print 'RUNNING ' + str(len(cmds)) + ' READ SHARDS ACROSS ' + str(nProcs) + ' PROCESSES'
+    pool = multiprocessing.Pool(nProcs)
+    try:
+        retCodes = pool.map(runCmd,cmds)
+    except:
+        print "ERROR: Failure to execute sharded snow reads"
+        pool.terminate()
+        raise
+    pool.close()
+    pool.join()
+    
+    failCmds = [cmds[i] for i in range(0,len(cmds)) if retCodes[i] != 0]
+    if len(failCmds) != 0:
+        for cmd in failCmds:
+            print "ERROR: Snow read shard failed: " + cmd
+        raise
+        
+    for shardOut in shardFiles:
+        if not os.path.isfile(shardOut):
+            print "ERROR: Expected shard output: " + shardOut + " not found."
+            raise
+            
+    # Merge shards into final output file.
+    mergeShards(shardFiles,outPath,naOmit,tmpRFile,tmpRFile[:-2] + "_MERGE.R",
+                regionFlag,nProcs)
+    
+    # Remove shard output and namelist files.
+    for tmpFile in shardFiles + shardRFiles:
+        try:
+            os.remove(tmpFile)
+        except:
+            print "ERROR: Failure to remove temporary shard file: " + tmpFile
+            raise
+            
+def findExistingRead(outPath,endDateObj):
+    # Function to find an existing read product in the job directory with
+    # the same beginning date as outPath (named ..._YYYYMMDDHH_YYYYMMDDHH), 
+    # ending before endDateObj. The product with the latest ending date is 
+    # returned, along with its ending date. 
+    stem, ext = os.path.splitext(outPath)
+    existPath = None
+    existEndObj = None
+    for fileTmp in glob.glob(stem[:-10] + "??????????" + ext):
+        endStr = os.path.splitext(fileTmp)[0][-10:]
+        if not endStr.isdigit():
+            continue
+        endTmp = datetime.datetime.strptime(endStr,'%Y%m%d%H')
+        if endTmp >= endDateObj:
+            continue
+        if existEndObj is None or endTmp > existEndObj:
+            existPath = fileTmp
+            existEndObj = endTmp
+    return existPath, existEndObj
+    
+def appendRead(args,rScript,tmpRFile,outPath,products,naOmit,begDateObj,endDateObj,
+               existPath,existEndObj):
+    # Function to extend an existing read product (existPath) to endDateObj.
+    # Only days after the existing product are read, into a partial product
+    # which is then merged with the existing product into outPath. Basin 
+    # reads start on the day after dateStart, while point reads start on 
+    # dateStart. The existing product is left in place.
+    if naOmit == 'none':
+        newBegObj = existEndObj
+    else:
+        newBegObj = existEndObj + datetime.timedelta(days=1)
+    print 'APPENDING ' + newBegObj.strftime('%Y-%m-%d %H') + ' TO ' + \
+          endDateObj.strftime('%Y-%m-%d %H') + ' TO: ' + existPath
+    
+    # Compose namelist for partial read. 
+    partPath = os.path.splitext(outPath)[0] + "_APPEND" + os.path.splitext(outPath)[1]
+    appendRFile = tmpRFile[:-2] + "_APPEND.R"
+    # A partial product left behind by a failed run is stale.
+    if os.path.isfile(partPath):
+        print "WARNING: Removing stale partial read: " + partPath
+        try:
+            os.remove(partPath)
+        except:
+            print "ERROR: Failure to remove stale partial read: " + partPath
+            raise
+    newBegStr = "dateStart <- as.POSIXct('" + newBegObj.strftime('%Y-%m-%d %H') + \
+                ":00', format='%Y-%m-%d %H:%M', tz='UTC')\n"
+    try:
+        shutil.copy(tmpRFile,appendRFile)
+        ioMgmntMod.writeStrToFile(appendRFile,newBegStr)
+        ioMgmntMod.writeStrToFile(appendRFile,"outFile <- '" + partPath + "'\n")
+    except:
+        print "ERROR: Unable to create append R namelist file."
+        raise
+        
+    runSnowRead(args,rScript,appendRFile,partPath,products,naOmit,newBegObj,endDateObj,
+                appendCheck=0)
+    if not os.path.isfile(partPath):
+        print "ERROR: Expected partial read output: " + partPath + " not found."
+        raise
+        
+    # Merge existing and partial products. Stations dropped from one for 
+    # missing values are dropped from the other.
+    mergeRFile = tmpRFile[:-2] + "_MERGE.R"
+    try:
+        shutil.copy(tmpRFile,mergeRFile)
+        ioMgmntMod.writeStrToFile(mergeRFile,"appendFiles <- c('" + existPath + "', '" + \
+                                  partPath + "')\n")
+        ioMgmntMod.writeStrToFile(mergeRFile,newBegStr.replace('dateStart','appendStart'))
+        ioMgmntMod.writeStrToFile(mergeRFile,"outFile <- '" + outPath + "'\n")
+        ioMgmntMod.writeStrToFile(mergeRFile,"naOmit <- '" + naOmit + "'\n")
+    except:
+        print "ERROR: Unable to create append merge R namelist file."
+        raise
+        
+    cmd = "Rscript ./R/MERGE_SNOW_SHARDS.R " + mergeRFile
+    try:
+        retCode = subprocess.call(cmd,shell=True)
+    except:
+        print "ERROR: Failure to merge appended snow reads."
+        raise
+    if retCode != 0:
+        print "ERROR: Append merge program exited with code: " + str(retCode)
+        raise
+    if not os.path.isfile(outPath):
+        print "ERROR: Merged output: " + outPath + " not found."
+        raise
+        
+    # Remove partial product and temporary namelists.
+    for tmpFile in [partPath,appendRFile,mergeRFile]:
+        try:
+            os.remove(tmpFile)
+        except:
+            print "ERROR: Failure to remove temporary append file: " + tmpFile
+            raise
+            
+def mergeShards(shardFiles,outPath,naOmit,tmpRFile,mergeRFile,regionFlag=0,nProcs=1):
+    # Function to merge partial read tables in shardFiles into outPath using
+    # MERGE_SNOW_SHARDS.R. The merge namelist is a copy of the read namelist
+    # with shard information appended. If regionFlag is 1, shards hold
+    # basin reads split by region across nProcs processes.
+    shardStr = "shardFiles <- c("
+    for i in range(0,len(shardFiles)):
+        if i == (len(shardFiles) - 1):
+            shardStr = shardStr + "'" + shardFiles[i] + "')"
+        else:
+            shardStr = shardStr + "'" + shardFiles[i] + "', "
+    shardStr = shardStr + "\n"
+    try:
+        shutil.copy(tmpRFile,mergeRFile)
+        ioMgmntMod.writeStrToFile(mergeRFile,shardStr)
+        ioMgmntMod.writeStrToFile(mergeRFile,"outFile <- '" + outPath + "'\n")
+        ioMgmntMod.writeStrToFile(mergeRFile,"naOmit <- '" + naOmit + "'\n")
+        if regionFlag == 1:
+            ioMgmntMod.writeStrToFile(mergeRFile,"regionMerge <- 1\n")
+            ioMgmntMod.writeStrToFile(mergeRFile,"size <- " + str(nProcs) + "\n")
+    except:
+        print "ERROR: Unable to create shard merge R namelist file."
+        raise
+        
+    cmd = "Rscript ./R/MERGE_SNOW_SHARDS.R " + mergeRFile
+    try:
+        retCode = subprocess.call(cmd,shell=True)
+    except:
+        print "ERROR: Failure to merge snow read shards."
+        raise
+    if retCode != 0:
+        print "ERROR: Shard merge program exited with code: " + str(retCode)
+        raise
+    if not os.path.isfile(outPath):
+        print "ERROR: Merged output: " + outPath + " not found."
+        raise
+    os.remove(mergeRFile)
+    
+def buildReadShards(products,nDays,nProcs):
+    # Function to split read work into [begDay,endDay,product] shards. Days
+    # are indices from the beginning date (0 to nDays). Each product is split
+    # into enough day ranges to give roughly nProcs shards in total.
+    numDayRanges = int(math.ceil(float(nProcs)/float(len(products))))
+    numDayRanges = max(1,min(numDayRanges,nDays+1))
+    daysPerRange = int(math.ceil(float(nDays+1)/float(numDayRanges)))
+    shards = []
+    for product in products:
+        dayBeg = 0
+        while dayBeg <= nDays:
+            dayEnd = min(dayBeg + daysPerRange - 1,nDays)
+            shards.append([dayBeg,dayEnd,product])
+            dayBeg = dayEnd + 1
+    return shards
+    
+def runCmd(cmd):
+    # Worker function to run a shell command in a separate process.
+    return subprocess.call(cmd,shell=True)
@@ -0,0 +1,180 @@
+# Module file for maintaining a local cache of snow observations pulled
+# from the NWM snow database. Observations are stored in month-partitioned
+# SQLite files keyed by unique ID and observation time. An index file keeps
+# track of the time ranges already pulled from the server, along with a
+# copy of the meta table. Only missing time ranges, or meta data that has
+# changed on the server, need to be pulled on subsequent extractions.
+
+# Logan Karsten
+# National Center for Atmospheric Research
+# Research Applications Laboratory
+
+import sqlite3
+import os
+import calendar
+import datetime
+
+# Observations within this many days of the current time are re-pulled on
+# every extraction, as late or QC-revised reports may still arrive. Only
+# time ranges older than this are recorded as covered.
+refreshLagDays = 3
+
+def openCache(cacheDir):
+    # Open the cache index file, creating the cache directory and tables
+    # if they do not exist yet.
+    if not os.path.isdir(cacheDir):
+        try:
+            os.makedirs(cacheDir)
+        except:
+            print "ERROR: Unable to create observation cache directory: " + cacheDir
+            raise
+
+    idxConn = sqlite3.connect(cacheDir + "/SNOW_OBS_CACHE_INDEX.db")
+    idxConn.execute("create table if not exists coverage (obsTable text, filterKey text, " + \
+                    "begSec integer, endSec integer)")
+    idxConn.execute("create table if not exists meta (filterKey text, checksum text, pos integer, " + \
+                    "uniqueId integer, network text, id text, latitude real, longitude real)")
+    idxConn.commit()
+
+    return idxConn
+
+def openPartition(cacheDir,monthStr):
+    # Open the month partition holding observations for monthStr (YYYYMM),
+    # creating it if necessary.
+    partConn = sqlite3.connect(cacheDir + "/SNOW_OBS_CACHE_" + monthStr + ".db")
+    for tableName in ['NWM_SWE','NWM_SD']:
+        partConn.execute("create table if not exists " + tableName + " (uniqueId integer, " + \
+                         "obsDate integer, value real, primary key (uniqueId, obsDate))")
+    partConn.commit()
+
+    return partConn
+
+def getMeta(idxConn,filterKey,checksum,fetchMeta):
+    # Return meta data rows for the network/station filter. If the cached
+    # rows were pulled with the same server checksum, they are returned
+    # directly. Otherwise, fetchMeta is called to pull the rows from the
+    # server, and the cache is updated.
+    if checksum is not None:
+        cur = idxConn.execute("select count(*) from meta where filterKey=? and checksum=?",
+                              (filterKey,checksum))
+        if cur.fetchone()[0] > 0:
+            cur = idxConn.execute("select uniqueId, network, id, latitude, longitude from meta " + \
+                                  "where filterKey=? order by pos asc",(filterKey,))
+            print 'USING CACHED METADATA'
+            return cur.fetchall()
+
+    resultMeta = fetchMeta()
+
+    idxConn.execute("delete from meta where filterKey=?",(filterKey,))
+    rowsOut = []
+    for i in range(0,len(resultMeta)):
+        rowsOut.append((filterKey,checksum,i,int(resultMeta[i][0]),str(resultMeta[i][1]),
+                        str(resultMeta[i][2]),float(resultMeta[i][3]),float(resultMeta[i][4])))
+    idxConn.executemany("insert into meta values (?,?,?,?,?,?,?,?)",rowsOut)
+    idxConn.commit()
+
+    return resultMeta
+
+def findGaps(idxConn,obsTable,filterKey,begSec,endSec):
+    # Return list of [lo,hi) second ranges within [begSec,endSec) that have
+    # not been pulled from the server for this filter. Ranges pulled without
+    # any network/station filter cover every filter.
+    cur = idxConn.execute("select begSec, endSec from coverage where obsTable=? and " + \
+                          "(filterKey=? or filterKey='') order by begSec asc",(obsTable,filterKey))
+    gaps = []
+    lo = begSec
+    for covBeg, covEnd in cur.fetchall():
+        if covEnd <= lo:
+            continue
+        if covBeg >= endSec:
+            break
+        if covBeg > lo:
+            gaps.append([lo,covBeg])
+        lo = max(lo,covEnd)
+        if lo >= endSec:
+            break
+    if lo < endSec:
+        gaps.append([lo,endSec])
+
+    return gaps
+
+def storeObs(cacheDir,obsTable,rows,partConns):
+    # Place observation rows (unique ID, value, datetime) into their month
+    # partitions. Partition connections are kept open in partConns. Missing
+    # values are stored as NULL.
+    rowsMonth = {}
+    for row in rows:
+        monthStr = row[2].strftime('%Y%m')
+        if monthStr not in rowsMonth:
+            rowsMonth[monthStr] = []
+        valueTmp = None
+        if row[1] is not None:
+            valueTmp = float(row[1])
+        rowsMonth[monthStr].append((int(row[0]),calendar.timegm(row[2].timetuple()),valueTmp))
+
+    for monthStr in rowsMonth.keys():
+        if monthStr not in partConns:
+            partConns[monthStr] = openPartition(cacheDir,monthStr)
+        partConns[monthStr].executemany("insert or replace into " + obsTable + " values (?,?,?)",
+                                        rowsMonth[monthStr])
+
+def getObs(cacheDir,idxConn,obsTable,filterKey,begDateObj,endDateObj,fetchObs):
+    # Return observation rows strictly between begDateObj and endDateObj for
+    # the network/station filter. Missing time ranges are first pulled from
+    # the server using fetchObs(obsTable,loDateStr,hiDateStr), which yields
+    # chunks of rows in [loDateStr,hiDateStr). Rows are returned ordered
+    # by observation time as (unique ID, value, datetime string), with
+    # missing values as NaN.
+    begSec = calendar.timegm(begDateObj.timetuple())
+    endSec = calendar.timegm(endDateObj.timetuple())
+
+    # Coverage is never recorded past the refresh lag, so the trailing
+    # window is pulled again on every extraction.
+    covMaxSec = calendar.timegm(datetime.datetime.utcnow().timetuple()) - refreshLagDays*86400
+
+    # Fill any gaps in the cache from the server.
+    gaps = findGaps(idxConn,obsTable,filterKey,begSec+1,endSec)
+    for lo, hi in gaps:
+        loDateStr = datetime.datetime.utcfromtimestamp(lo).strftime('%Y-%m-%d %H:%M:%S')
+        hiDateStr = datetime.datetime.utcfromtimestamp(hi).strftime('%Y-%m-%d %H:%M:%S')
+        print 'PULLING ' + obsTable + ' FROM SERVER FOR: ' + loDateStr + ' TO ' + hiDateStr
+        partConns = {}
+        try:
+            for rows in fetchObs(obsTable,loDateStr,hiDateStr):
+                storeObs(cacheDir,obsTable,rows,partConns)
+            for monthStr in partConns.keys():
+                partConns[monthStr].commit()
+        finally:
+            # Close partitions even if the pull failed, releasing any locks
+            # held by uncommitted transactions.
+            for monthStr in partConns.keys():
+                partConns[monthStr].close()
+        # Only record coverage once observations have been committed, so an
+        # interrupted pull is re-done next time.
+        hiCov = min(hi,covMaxSec)
+        if hiCov > lo:
+            idxConn.execute("insert into coverage values (?,?,?,?)",(obsTable,filterKey,lo,hiCov))
+            idxConn.commit()
+
+    # Read observations back out of the month partitions in order.
+    resultObs = []
+    monthCurrent = datetime.datetime(begDateObj.year,begDateObj.month,1)
+    while monthCurrent <= endDateObj:
+        monthStr = monthCurrent.strftime('%Y%m')
+        partPath = cacheDir + "/SNOW_OBS_CACHE_" + monthStr + ".db"
+        if os.path.isfile(partPath):
+            partConn = sqlite3.connect(partPath)
+            cur = partConn.execute("select uniqueId, value, datetime(obsDate,'unixepoch') from " + \
+                                   obsTable + " where obsDate>? and obsDate<? order by obsDate, uniqueId",
+                                   (begSec,endSec))
+            for row in cur.fetchall():
+                if row[1] is None:
+                    row = (row[0],float('nan'),row[2])
+                resultObs.append(row)
+            partConn.close()
+        if monthCurrent.month == 12:
+            monthCurrent = datetime.datetime(monthCurrent.year+1,1,1)
+        else:
+            monthCurrent = datetime.datetime(monthCurrent.year,monthCurrent.month+1,1)
+
+    return resultObs
@@ -5,14 +5,23 @@
 # Research Applications Laboratory
 
 import MySQLdb
+import MySQLdb.cursors
 import pandas as pd
 import numpy as np
 from netCDF4 import Dataset
 import os
 import datetime
 import subprocess
+import hashlib
+import threading
+import Queue
+import multiprocessing
+import sys
+import traceback
+import snowCacheMod
 
-def extractObs(begRDateObj,endRDateObj,outDir,geoFile,networkFile='',stnFile='',maskFile=''):
+def extractObs(begRDateObj,endRDateObj,outDir,geoFile,networkFile='',stnFile='',maskFile='',chunkSize=0,cacheDir='',
+               nConn=1,shardDays=30,dailyFlag=0):
     # Establish paths
     fileOut = outDir + "/" + "SNOW_DB_OBS_" + begRDateObj.strftime('%Y%m%d%H') + \
               "_" + endRDateObj.strftime('%Y%m%d%H') + '.nc'
@@ -22,77 +31,194 @@ def extractObs(begRDateObj,endRDateObj,outDir,geoFile,networkFile='',stnFile='',
         print "ERROR: Unable to locate input geogrid file"
         raise
 
-    # Establish DB information
-    hostName = 'hydro-c1-web.rap.ucar.edu'
-    userName = 'logan'
-    psWd = 'DHood$1948'
-    dbName = 'NWM_snow_obs'
     # Initialize connection with SQL
-    try:
-        dbSnow = MySQLdb.connect(hostName,userName,psWd,dbName)
-    except:
-        print "ERROR: Unable to connect to NWM Snow Database."
-        raise
+    dbSnow = connectDb()
     print 'CONNECTED TO DB'
 
     # Establish datetime strings to be used in command syntax            
     bDateStr = begRDateObj.strftime('%Y-%m-%d %H') + ':00:00'
     eDateStr = endRDateObj.strftime('%Y-%m-%d %H') + ':00:00'
-        
-    # Pull all SWE observations from time period.
-    cmd = "select * from NWM_SWE where date_obs>'" + bDateStr + "' and " + \
-    "date_obs<'" + eDateStr + "'" + " order by date_obs asc"
               
     # Create cursor object to execute SQL command
     conn = dbSnow.cursor()
         
     print 'ESTABLISHED CONNECTIVITY OBJECT'
-    # Execute command to pull SWE observations
+    # Pull column names from the meta/observation tables. These are used to
+    # compose subsetting commands so filtering happens on the server.
     try:
-        conn.execute(cmd)
-        resultSWE = conn.fetchall()
+        metaCols = getColumnNames(conn,'NWM_snow_meta')
+        obsCols = getColumnNames(conn,'NWM_SWE')
     except:
-        print "ERROR: Unable to pull SWE observations for analysis period."
+        print "ERROR: Unable to extract column information from snow database."
         raise
-        
-    print 'EXECUTED SQL COMMAND'
-    # Proceed to pull snow depth observations
-    cmd = "select * from NWM_SD where date_obs>'" + bDateStr + "' and " + \
-    "date_obs<'" + eDateStr + "'" + " order by date_obs asc"
-        
+    
+    # Compose network/station subsetting filter against the meta table.
     try:
-        conn.execute(cmd)
-        resultSD = conn.fetchall()
+        metaFilter, metaParams = buildMetaFilter(metaCols,networkFile,stnFile)
     except:
-        print "ERROR: Unable to pull Snow Depth observations for analysis period."
+        print "ERROR: Unable to compose network/station subsetting filter."
         raise
-            
-    print 'EXTRACTED SNOW OBS FROM FETCH'
-    # Proceed to pull metadata entries. This information will be used to 
+        
+    # Compose commands to pull SWE/snow depth observations from time period.
+    # Observations are restricted to stations passing the meta filter using
+    # a sub-query, so only relevant rows are returned by the server.
+    cmdSWE = buildObsCmd('NWM_SWE',obsCols,metaCols,metaFilter)
+    cmdSD = buildObsCmd('NWM_SD',obsCols,metaCols,metaFilter)
+    obsParams = tuple([bDateStr,eDateStr] + metaParams)
+    
+    # Pull metadata entries first. This information will be used to 
     # extract networks, etc.
-    cmd = "select * from NWM_snow_meta"
+    cmdMeta = buildMetaCmd(metaCols,metaFilter)
         
-    try:
-        conn.execute(cmd)
-        resultMeta = conn.fetchall()
-    except:
-        print "ERROR: Unable to extract snow metadata table information"
-        raise
+    if not cacheDir:
+        try:
+            conn.execute(cmdMeta,tuple(metaParams))
+            resultMeta = conn.fetchall()
+        except:
+            print "ERROR: Unable to extract snow metadata table information"
+            raise
             
-    print 'EXTRACTED METADATA INFORMATION'
-    # Close the SQL connection
-    conn.close()
+        print 'EXTRACTED METADATA INFORMATION'
+    
+    if cacheDir:
+        # Local cache mode. Meta data is only pulled from the server if the
+        # meta table checksum has changed, and observations are only pulled
+        # for time ranges not already present in the cache.
+        filterKey = ''
+        if metaFilter:
+            filterKey = hashlib.md5(metaFilter + '|' + ','.join(metaParams)).hexdigest()
+            
+        def fetchMeta():
+            conn.execute(cmdMeta,tuple(metaParams))
+            return conn.fetchall()
+            
+        def fetchObs(tableName,loDateStr,hiDateStr):
+            # Pull observations in [loDateStr,hiDateStr) in chunks.
+            cmdTmp = buildObsCmd(tableName,obsCols,metaCols,metaFilter,lowerOp='>=',hoursFlag=0)
+            if chunkSize > 0:
+                connTmp = dbSnow.cursor(MySQLdb.cursors.SSCursor)
+                fetchSize = chunkSize
+            else:
+                connTmp = dbSnow.cursor()
+                fetchSize = 0
+            connTmp.execute(cmdTmp,tuple([loDateStr,hiDateStr] + metaParams))
+            while True:
+                if fetchSize > 0:
+                    rows = connTmp.fetchmany(fetchSize)
+                else:
+                    rows = connTmp.fetchall()
+                if len(rows) == 0:
+                    break
+                yield rows
+                if fetchSize == 0:
+                    break
+            connTmp.close()
+            
+        try:
+            checksum = getTableChecksum(conn,'NWM_snow_meta')
+            cacheConn = snowCacheMod.openCache(cacheDir)
+            resultMeta = snowCacheMod.getMeta(cacheConn,filterKey,checksum,fetchMeta)
+            print 'EXTRACTED METADATA INFORMATION'
+            resultSWE = snowCacheMod.getObs(cacheDir,cacheConn,'NWM_SWE',filterKey,
+                                            begRDateObj,endRDateObj,fetchObs)
+            resultSD = snowCacheMod.getObs(cacheDir,cacheConn,'NWM_SD',filterKey,
+                                           begRDateObj,endRDateObj,fetchObs)
+            cacheConn.close()
+        except:
+            print "ERROR: Unable to pull snow observations through local cache: " + cacheDir
+            raise
+        print 'EXTRACTED SNOW OBS FROM CACHE'
+        conn.close()
+        dbSnow.close()
         
-    # If no ovservations were pulled, raise error.
-    if len(resultSWE) == 0 and len(resultSD) == 0:
-        print "ERROR: No observations extracted from database."
-        raise
+        # If no ovservations were pulled, raise error.
+        if len(resultSWE) == 0 and len(resultSD) == 0:
+            print "ERROR: No observations extracted from database."
+            raise
+            
+        fileNC = snowObsNC(fileOut,resultSWE,resultSD,resultMeta,'','',maskFile,dailyFlag=dailyFlag)
+    elif nConn > 1:
+        # Parallel mode. The analysis window is split into time shards, which
+        # are pulled concurrently for SWE and snow depth across a pool of
+        # database connections. Shards are merged back in time order.
+        conn.close()
+        dbSnow.close()
+        try:
+            shards, tasks = buildShardTasks(begRDateObj,endRDateObj,shardDays,obsCols,
+                                            metaCols,metaFilter,metaParams)
+            pool = openDbPool(nConn)
+            metaDf = subsetMeta(resultMeta,'','')
+            resultShards = pullShards(pool,nConn,tasks,metaDf.uniqueId.values)
+            closeDbPool(pool)
+        except:
+            print "ERROR: Unable to pull time sharded observations for analysis period."
+            raise
+        print 'EXTRACTED ' + str(len(tasks)) + ' SHARDS ACROSS ' + str(nConn) + ' CONNECTIONS'
+        
+        # Merge shards in time order
+        sweArrays = mergeShards(resultShards,'NWM_SWE',len(shards))
+        sdArrays = mergeShards(resultShards,'NWM_SD',len(shards))
+        
+        # If no ovservations were pulled, raise error.
+        if len(sweArrays[0]) == 0 and len(sdArrays[0]) == 0:
+            print "ERROR: No observations extracted from database."
+            raise
+            
+        fileNC = writeObsNC(fileOut,metaDf,sweArrays,sdArrays,dailyFlag=dailyFlag)
+    elif chunkSize > 0:
+        # Streaming mode. Observations are pulled through a server-side
+        # cursor in chunks and appended to the output NetCDF file, so 
+        # only one chunk of rows is held in memory at any given time.
+        conn.close()
+        conn = dbSnow.cursor(MySQLdb.cursors.SSCursor)
+        try:
+            fileNC = snowObsStreamNC(fileOut,conn,cmdSWE,cmdSD,obsParams,resultMeta,chunkSize)
+        except:
+            print "ERROR: Unable to stream snow observations into: " + fileOut
+            raise
+        conn.close()
+        dbSnow.close()
+    else:
+        # Network/station subsetting has already been performed on the server.
+        metaDf = subsetMeta(resultMeta,'','')
+        
+        # Execute command to pull SWE observations. Rows are decoded directly
+        # into typed arrays.
+        try:
+            conn.execute(cmdSWE,obsParams)
+            sweArrays = rowsToArrays(conn.fetchall(),metaDf.uniqueId.values)
+        except:
+            print "ERROR: Unable to pull SWE observations for analysis period."
+            raise
+        
+        print 'EXECUTED SQL COMMAND'
+        # Proceed to pull snow depth observations
+        try:
+            conn.execute(cmdSD,obsParams)
+            sdArrays = rowsToArrays(conn.fetchall(),metaDf.uniqueId.values)
+        except:
+            print "ERROR: Unable to pull Snow Depth observations for analysis period."
+            raise
+            
+        print 'EXTRACTED SNOW OBS FROM FETCH'
+        # Close the SQL connection
+        conn.close()
+        dbSnow.close()
+        
+        # If no ovservations were pulled, raise error.
+        if len(sweArrays[0]) == 0 and len(sdArrays[0]) == 0:
+            print "ERROR: No observations extracted from database."
+            raise
             
-    # Create output NetCDF file for R to read in during analysis for processing
-    # into basins, etc.
-    fileNC = snowObsNC(fileOut,resultSWE,resultSD,resultMeta,networkFile,stnFile,maskFile)
+        # Create output NetCDF file for R to read in during analysis for processing
+        # into basins, etc.
+        fileNC = writeObsNC(fileOut,metaDf,sweArrays,sdArrays,dailyFlag=dailyFlag)
         
     # Process into R dataset. 
+    processObsR(fileNC,geoFile,maskFile)
+        
+def processObsR(fileNC,geoFile,maskFile):
+    # Function to process extracted observations NetCDF file into R dataset. 
     if maskFile:
         print "MASK"
         cmd = "Rscript ./R/process_SNOW_OBS.R " + fileNC + " " + geoFile + \
@@ -107,8 +233,300 @@ def extractObs(begRDateObj,endRDateObj,outDir,geoFile,networkFile='',stnFile='',
     #except:
     #    print "ERROR: Unable to process snow observations into R dataset"
     #    raise
+    
+def extractObsBatch(windows,outDir,geoFile,networkFile='',stnFile='',maskFile='',
+                    nConn=1,shardDays=30,nWorkers=1,dailyFlag=0):
+    # Function to extract observations for a list of [begDate,endDate] windows
+    # in one invocation. One connection pool and one meta data pull are 
+    # shared across all windows. Windows are pulled one at a time (with time 
+    # shards pulled concurrently across the pool), while NetCDF writes and R 
+    # post-processing for completed windows run on a pool of worker processes.
+    
+    # Check to make sure geogrid file exists
+    if not os.path.isfile(geoFile):
+        print "ERROR: Unable to locate input geogrid file"
+        raise
+        
+    # Worker processes are started before any database connections are
+    # opened, so they do not inherit live connection sockets.
+    workerPool = multiprocessing.Pool(nWorkers)
+    pool = None
+    emptyFiles = []
+    try:
+        # Open pool of connections. The first is used to pull column/meta 
+        # information.
+        pool = openDbPool(nConn)
+        dbSnow = pool.get()
+        conn = dbSnow.cursor()
+        try:
+            metaCols = getColumnNames(conn,'NWM_snow_meta')
+            obsCols = getColumnNames(conn,'NWM_SWE')
+            metaFilter, metaParams = buildMetaFilter(metaCols,networkFile,stnFile)
+            cmdMeta = buildMetaCmd(metaCols,metaFilter)
+            conn.execute(cmdMeta,tuple(metaParams))
+            resultMeta = conn.fetchall()
+        except:
+            print "ERROR: Unable to extract snow metadata table information"
+            raise
+        finally:
+            conn.close()
+            pool.put(dbSnow)
+        print 'EXTRACTED METADATA INFORMATION'
+        metaDf = subsetMeta(resultMeta,'','')
+        
+        # Loop through windows. Completed windows are handed off to the worker
+        # pool. Limit the number of outstanding windows to bound memory.
+        pending = []
+        for begDateObj, endDateObj in windows:
+            fileOut = outDir + "/" + "SNOW_DB_OBS_" + begDateObj.strftime('%Y%m%d%H') + \
+                      "_" + endDateObj.strftime('%Y%m%d%H') + '.nc'
+            if os.path.isfile(fileOut):
+                print "ERROR: Output Snow file: " + fileOut + " already exists"
+                raise
+            try:
+                shards, tasks = buildShardTasks(begDateObj,endDateObj,shardDays,obsCols,
+                                                metaCols,metaFilter,metaParams)
+                resultShards = pullShards(pool,nConn,tasks,metaDf.uniqueId.values)
+            except:
+                print "ERROR: Unable to pull observations for: " + fileOut
+                raise
+            sweArrays = mergeShards(resultShards,'NWM_SWE',len(shards))
+            sdArrays = mergeShards(resultShards,'NWM_SD',len(shards))
+            del resultShards
+            print 'EXTRACTED OBSERVATIONS FOR: ' + fileOut
+            
+            # Windows without observations are an error, as with extractObs. 
+            # They are reported once the remaining windows are finished.
+            if len(sweArrays[0]) == 0 and len(sdArrays[0]) == 0:
+                print "WARNING: No observations extracted from database for: " + fileOut
+                emptyFiles.append(fileOut)
+                continue
+                
+            if len(pending) >= nWorkers:
+                pending.pop(0).get()
+            pending.append(workerPool.apply_async(writeProcessWindow,(fileOut,metaDf,sweArrays,
+                                                  sdArrays,geoFile,maskFile,dailyFlag)))
+            
+        # Wait for remaining windows to finish. Errors in workers are raised here.
+        for result in pending:
+            result.get()
+    except:
+        print "ERROR: Failure to extract/process observation windows."
+        workerPool.terminate()
+        raise
+    finally:
+        if pool is not None:
+            closeDbPool(pool)
+    workerPool.close()
+    workerPool.join()
+    
+    if len(emptyFiles) != 0:
+        for fileOut in emptyFiles:
+            print "ERROR: No observations extracted from database for: " + fileOut
+        raise
+    
+def writeProcessWindow(fileOut,metaDf,sweArrays,sdArrays,geoFile,maskFile,dailyFlag):
+    # Worker function to write one extraction window to NetCDF and process
+    # it into an R dataset.
+    fileNC = writeObsNC(fileOut,metaDf,sweArrays,sdArrays,dailyFlag=dailyFlag)
+    processObsR(fileNC,geoFile,maskFile)
         
-def snowObsNC(fileOut,resultSWE,resultSD,resultMeta,networkFile,stnFile,mskFile):
+def connectDb():
+    # Function to open a connection to the NWM snow database.
+    
+    # Establish DB information
+    hostName = 'hydro-c1-web.rap.ucar.edu'
+    userName = 'logan'
+    psWd = 'DHood$1948'
+    dbName = 'NWM_snow_obs'
+    try:
+        dbSnow = MySQLdb.connect(hostName,userName,psWd,dbName)
+    except:
+        print "ERROR: Unable to connect to NWM Snow Database."
+        raise
+        
+    return dbSnow
+    
+def openDbPool(nConn):
+    # Function to open a pool of nConn database connections. Connections 
+    # are checked out/in by worker threads through a queue.
+    pool = Queue.Queue()
+    for i in range(0,nConn):
+        pool.put(connectDb())
+    return pool
+    
+def closeDbPool(pool):
+    # Function to close all connections held in a pool.
+    while not pool.empty():
+        pool.get().close()
+        
+def buildShards(begDateObj,endDateObj,shardDays):
+    # Function to split an analysis window into consecutive time shards of 
+    # shardDays length. The final shard is truncated at the end date.
+    shards = []
+    dStep = datetime.timedelta(days=shardDays)
+    dCurrent = begDateObj
+    while dCurrent < endDateObj:
+        dNext = min(dCurrent + dStep,endDateObj)
+        shards.append([dCurrent,dNext])
+        dCurrent = dNext
+    return shards
+    
+def buildShardTasks(begDateObj,endDateObj,shardDays,obsCols,metaCols,metaFilter,metaParams):
+    # Function to compose the list of [key,cmd,params] tasks used to pull 
+    # SWE/snow depth for each time shard. The first shard excludes the 
+    # beginning date, all others include it, so shards do not overlap and 
+    # together match the window pulled by a single query.
+    shards = buildShards(begDateObj,endDateObj,shardDays)
+    tasks = []
+    for tableName in ['NWM_SWE','NWM_SD']:
+        for i in range(0,len(shards)):
+            if i == 0:
+                lowerOp = '>'
+            else:
+                lowerOp = '>='
+            cmdTmp = buildObsCmd(tableName,obsCols,metaCols,metaFilter,lowerOp=lowerOp)
+            paramsTmp = tuple([shards[i][0].strftime('%Y-%m-%d %H:%M:%S'),
+                               shards[i][1].strftime('%Y-%m-%d %H:%M:%S')] + metaParams)
+            tasks.append([(tableName,i),cmdTmp,paramsTmp])
+    return shards, tasks
+    
+def pullShards(pool,nConn,tasks,uniquesIn):
+    # Function to execute a list of [key,cmd,params] tasks concurrently using
+    # nConn worker threads, each checking out a connection from the pool.
+    # Results are converted to typed arrays as each task completes, and 
+    # returned in a dictionary keyed by task key.
+    taskQueue = Queue.Queue()
+    for task in tasks:
+        taskQueue.put(task)
+    results = {}
+    errors = []
+    
+    def worker():
+        while True:
+            try:
+                key, cmd, params = taskQueue.get_nowait()
+            except Queue.Empty:
+                return
+            dbConn = pool.get()
+            try:
+                cur = dbConn.cursor()
+                cur.execute(cmd,params)
+                results[key] = rowsToArrays(cur.fetchall(),uniquesIn)
+                cur.close()
+            except:
+                # Keep the exception so it can be reported and re-raised
+                # from the main thread.
+                errors.append((key,sys.exc_info()))
+            pool.put(dbConn)
+            
+    threads = []
+    for i in range(0,nConn):
+        threads.append(threading.Thread(target=worker))
+        threads[i].start()
+    for i in range(0,nConn):
+        threads[i].join()
+        
+    if len(errors) != 0:
+        for key, excInfo in errors:
+            print "ERROR: Failure to pull shard: " + str(key)
+            traceback.print_exception(*excInfo)
+        raise errors[0][1][0], errors[0][1][1], errors[0][1][2]
+        
+    return results
+    
+def mergeShards(resultShards,tableName,numShards):
+    # Function to concatenate shard arrays for a table in time order.
+    idsOut = np.concatenate([resultShards[(tableName,i)][0] for i in range(0,numShards)])
+    valsOut = np.concatenate([resultShards[(tableName,i)][1] for i in range(0,numShards)])
+    datesOut = np.concatenate([resultShards[(tableName,i)][2] for i in range(0,numShards)])
+    return idsOut, valsOut, datesOut
+    
+def getColumnNames(conn,tableName):
+    # Function to return the ordered list of column names for a database
+    # table. No rows are pulled.
+    conn.execute("select * from " + tableName + " limit 0")
+    return [col[0] for col in conn.description]
+    
+def getTableChecksum(conn,tableName):
+    # Function to return the server checksum of a table. This is used to
+    # detect changes to the meta table. None is returned if the server
+    # is unable to compute a checksum.
+    try:
+        conn.execute("checksum table " + tableName)
+        return str(conn.fetchone()[1])
+    except:
+        return None
+    
+def buildObsCmd(tableName,obsCols,metaCols,metaFilter,lowerOp='>',hoursFlag=1):
+    # Function to compose a parameterized command to pull observations
+    # from tableName between two dates. Only the unique ID, value, and 
+    # observation time columns are requested. If hoursFlag is set, the
+    # observation time is returned as integer hours since EPOCH, computed
+    # on the server, otherwise as a datetime. If a meta filter is passed,
+    # observations are restricted to stations passing the filter using a
+    # sub-query against the meta table. Parameters are the beginning date,
+    # ending date, followed by the meta filter parameters.
+    if hoursFlag == 1:
+        dateCol = "timestampdiff(hour,'1970-01-01 00:00:00',date_obs)"
+    else:
+        dateCol = "date_obs"
+    cmd = "select " + obsCols[0] + "," + obsCols[1] + "," + dateCol + " from " + tableName + \
+          " where date_obs" + lowerOp + "%s and date_obs<%s"
+    if metaFilter:
+        cmd = cmd + " and " + obsCols[0] + " in (select " + metaCols[0] + \
+              " from NWM_snow_meta where " + metaFilter + ")"
+    cmd = cmd + " order by date_obs asc"
+    return cmd
+    
+def buildMetaCmd(metaCols,metaFilter):
+    # Function to compose command to pull the unique ID, network, station ID,
+    # latitude, and longitude columns from the meta table.
+    cmd = "select " + ",".join(metaCols[0:5]) + " from NWM_snow_meta"
+    if metaFilter:
+        cmd = cmd + " where " + metaFilter
+    return cmd
+    
+def buildMetaFilter(metaCols,networkFile,stnFile):
+    # Function to compose a parameterized SQL filter against the
+    # NWM_snow_meta table based on either a network subsetting file, or
+    # a station subsetting file. The first meta column is the unique ID,
+    # the second is a comma separated list of networks. An empty filter
+    # is returned if no subsetting has been requested.
+    metaFilter = ''
+    metaParams = []
+    if networkFile:
+        networks = pd.read_csv(networkFile)
+        # Strip whitespace around commas in the network list so 
+        # FIND_IN_SET matches the individual network names. Tabs/newlines
+        # become spaces, and runs of spaces (up to 32) are collapsed to a
+        # single space, leaving at most one space on either side of a comma.
+        netCol = metaCols[1]
+        for wsChar in ['char(9)','char(10)','char(13)']:
+            netCol = "replace(" + netCol + "," + wsChar + ",' ')"
+        for i in range(0,5):
+            netCol = "replace(" + netCol + ",'  ',' ')"
+        netCol = "trim(replace(replace(" + netCol + ",', ',','),' ,',','))"
+        netChecks = []
+        for j in range(0,len(networks.network)):
+            netChecks.append("find_in_set(%s," + netCol + ")")
+            metaParams.append(str(networks.network[j]).strip())
+        if len(netChecks) == 0:
+            print "ERROR: No networks found in: " + networkFile
+            raise
+        metaFilter = "(" + " or ".join(netChecks) + ")"
+    elif stnFile:
+        stationSub = pd.read_csv(stnFile)
+        for j in range(0,len(stationSub.uniqueID)):
+            metaParams.append(str(stationSub.uniqueID[j]))
+        if len(metaParams) == 0:
+            print "ERROR: No stations found in: " + stnFile
+            raise
+        metaFilter = metaCols[0] + " in (" + ",".join(["%s"]*len(metaParams)) + ")"
+        
+    return metaFilter, metaParams
+        
+def snowObsNC(fileOut,resultSWE,resultSD,resultMeta,networkFile,stnFile,mskFile,dailyFlag=0):
     # Function to output extracted snow observations to NetCDF file. This
     # file will be read in by R for processing.
     
@@ -117,92 +535,47 @@ def snowObsNC(fileOut,resultSWE,resultSD,resultMeta,networkFile,stnFile,mskFile)
         print "ERROR: Output Snow file: " + fileOut + " already exists"
         raise
         
-    # Establish EPOCH datetime object
-    epoch = datetime.datetime.utcfromtimestamp(0)
+    # Subset station meta data based on network/station lists
+    metaDf = subsetMeta(resultMeta,networkFile,stnFile)
     
-    # Establish data lengths
-    siteLen = len(resultMeta)
-    numSweObs = len(resultSWE)
-    numSdObs = len(resultSD)
-
-    # Initialize empty array to hold ID values
-    uniquesOut = []
-    idsOut = []
-    networksOut = []
-    latsOut = []
-    lonsOut = []    
-    # If network subsetting file exists, read it in.
-    if networkFile:
-        networks = pd.read_csv(networkFile)
-        for i in range(0,siteLen):
-            for j in range(0,len(networks.network)):
-                metaSplit = [x.strip() for x in resultMeta[i][1].split(',')]
-                if networks.network[j] in metaSplit:
-                    uniquesOut.append(resultMeta[i][0])
-                    networksOut.append(resultMeta[i][1])
-                    idsOut.append(resultMeta[i][2])
-                    latsOut.append(resultMeta[i][3])
-                    lonsOut.append(resultMeta[i][4])
-    elif stnFile:
-        stationSub = pd.read_csv(stnFile)
-        for i in range(siteLen):
-            for j in range(0,len(stationSub.uniqueID)):
-                if str(stationSub.uniqueID[j]) == str(resultMeta[i][0]):
-                    uniquesOut.append(resultMeta[i][0])
-                    networksOut.append(resultMeta[i][1])
-                    idsOut.append(resultMeta[i][2])
-                    latsOut.append(resultMeta[i][3])
-                    lonsOut.append(resultMeta[i][4])
+    # Convert observations to typed arrays, keeping only stations present
+    # in the meta data. Datetime information will be stored as hours since 
+    # EPOCH. That is easier than trying to keep the datetime string.
+    uniqueSWEOut, sweOut, sweDateOut = obsToArrays(resultSWE,metaDf.uniqueId.values)
+    uniqueSDOut, sdOut, sdDateOut = obsToArrays(resultSD,metaDf.uniqueId.values)
+            
+    return writeObsNC(fileOut,metaDf,(uniqueSWEOut,sweOut,sweDateOut),
+                      (uniqueSDOut,sdOut,sdDateOut),dailyFlag=dailyFlag)
+    
+def writeObsNC(fileOut,metaDf,sweArrays,sdArrays,dailyFlag=0):
+    # Function to write station meta data along with typed SWE/snow depth
+    # arrays (unique ID, value, hours since EPOCH) to NetCDF file. If 
+    # dailyFlag is set, observations are first aggregated to daily means,
+    # with the daily count/min/max written alongside.
+    if dailyFlag == 1:
+        uniqueSWEOut, sweOut, sweDateOut, sweCount, sweMin, sweMax = dailyAggregate(sweArrays)
+        uniqueSDOut, sdOut, sdDateOut, sdCount, sdMin, sdMax = dailyAggregate(sdArrays)
     else:
-        for i in range(0,siteLen):
-            uniquesOut.append(resultMeta[i][0])
-            networksOut.append(resultMeta[i][1])
-            idsOut.append(resultMeta[i][2])
-            latsOut.append(resultMeta[i][3])
-            lonsOut.append(resultMeta[i][4])
+        uniqueSWEOut, sweOut, sweDateOut = sweArrays
+        uniqueSDOut, sdOut, sdDateOut = sdArrays
     
-    # Ensure no duplicate unique IDs are present
-    #uniquesOut = list(set(uniquesOut))
-    #networksOut = list(set(networksOut))
-    #idsOut = list(set(idsOut))
-    #latsOut = list(set(latsOut))
-    #lonsOut = list(set(lonsOut))
-    
-    uniqueSWEOut = []
-    uniqueSDOut = []
-    sweOut = []
-    sdOut = []
-    # Datetime information will be stored as hours since EPOCH. That is
-    # easier than trying to keep the datetime string.
-    sweDateOut = []
-    sdDateOut = []
-    
-    # Loop through and create output arrays
-    # SWE first
-    for i in range(0,numSweObs):
-        if resultSWE[i][0] in uniquesOut:
-            uniqueSWEOut.append(resultSWE[i][0])
-            sweOut.append(resultSWE[i][1])
-            sweDateOut.append(int((resultSWE[i][2]-epoch).total_seconds()/3600.0))
-        
-    # Snow Depth next
-    for i in range(0,numSdObs):
-        if resultSD[i][0] in uniquesOut:
-            uniqueSDOut.append(resultSD[i][0])
-            sdOut.append(resultSD[i][1])
-            sdDateOut.append(int((resultSD[i][2]-epoch).total_seconds()/3600.0))
-            
+    # First check to make sure output file doesn't already exist
+    if os.path.isfile(fileOut):
+        print "ERROR: Output Snow file: " + fileOut + " already exists"
+        raise
+        
     # Create output NetCDF file.
     idOut = Dataset(fileOut,'w')
     
     # Dimensions
-    metaDim1 = idOut.createDimension('numStations',len(uniquesOut))
+    metaDim1 = idOut.createDimension('numStations',len(metaDf.uniqueId))
     sweDim1 = idOut.createDimension('numSweObs',len(sweOut))
     sdDim1 = idOut.createDimension('numSdObs',len(sdOut))
     
     # Global attributes
     idOut.institution = 'National Center for Atmospheric Research'
     idOut.comment = 'Observations originally provided by the Office of Water Prediction'
+    idOut.dailyAggregated = dailyFlag
     
     # Variables
     obsIds = idOut.createVariable('ptUniqueIds','i4',('numStations'),zlib=True,complevel=2)
@@ -220,24 +593,210 @@ def snowObsNC(fileOut,resultSWE,resultSD,resultMeta,networkFile,stnFile,mskFile)
     sdObsIds = idOut.createVariable('sdObsIds','i4',('numSdObs'),zlib=True,complevel=2)    
     sdObsDates = idOut.createVariable('sdObsDates','i4',('numSdObs'),zlib=True,complevel=2)
     sdObsDates.units = 'Hours since 1970-01-01 00:00:00'
+    if dailyFlag == 1:
+        sweObs.cell_methods = 'time: mean (daily)'
+        sdObs.cell_methods = 'time: mean (daily)'
+        sweObsCount = idOut.createVariable('sweObsCount','i4',('numSweObs'),zlib=True,complevel=2)
+        sweObsMin = idOut.createVariable('sweObsMin','f4',('numSweObs'),zlib=True,complevel=2)
+        sweObsMax = idOut.createVariable('sweObsMax','f4',('numSweObs'),zlib=True,complevel=2)
+        sdObsCount = idOut.createVariable('sdObsCount','i4',('numSdObs'),zlib=True,complevel=2)
+        sdObsMin = idOut.createVariable('sdObsMin','f4',('numSdObs'),zlib=True,complevel=2)
+        sdObsMax = idOut.createVariable('sdObsMax','f4',('numSdObs'),zlib=True,complevel=2)
     
     # Place date into output file
-    obsIds[:] = uniquesOut
-    latVar[:] = latsOut
-    lonVar[:] = lonsOut
+    obsIds[:] = metaDf.uniqueId.values
+    latVar[:] = metaDf.latitude.values
+    lonVar[:] = metaDf.longitude.values
     if len(sweOut) == 0:
         print 'WARNING: 0 SWE Observations Extracted From Database.'
     else:
-        sweObs[:] = np.array(sweOut,dtype=np.float32)
-        sweObsIds[:] = np.array(uniqueSWEOut, dtype=np.int32)
-        sweObsDates[:] = np.array(sweDateOut, dtype=np.int32)
+        sweObs[:] = sweOut
+        sweObsIds[:] = uniqueSWEOut
+        sweObsDates[:] = sweDateOut
+        if dailyFlag == 1:
+            sweObsCount[:] = sweCount
+            sweObsMin[:] = sweMin
+            sweObsMax[:] = sweMax
     if len(sdOut) == 0:
         print 'WARNING: 0 SD Observations Extracted From Database.'
     else:
-        sdObs[:] = np.array(sdOut,dtype=np.float32)
-        sdObsIds[:] = np.array(uniqueSDOut,dtype=np.int32)
-        sdObsDates[:] = np.array(sdDateOut,dtype=np.int32)
+        sdObs[:] = sdOut
+        sdObsIds[:] = uniqueSDOut
+        sdObsDates[:] = sdDateOut
+        if dailyFlag == 1:
+            sdObsCount[:] = sdCount
+            sdObsMin[:] = sdMin
+            sdObsMax[:] = sdMax
+    
+    # Close output file
+    idOut.close()
+    
+    # Return output NetCDF file to be processed into R dataset
+    return fileOut
+
+def subsetMeta(resultMeta,networkFile,stnFile):
+    # Function to subset station meta data rows based on either a network
+    # subsetting file, or a station subsetting file. If neither is passed,
+    # all stations are returned. Duplicate unique IDs are removed, keeping
+    # the first entry. A data frame of the first five meta columns is returned.
+    metaDf = pd.DataFrame([row[0:5] for row in resultMeta],
+                          columns=['uniqueId','network','id','latitude','longitude'])
+    
+    # If network subsetting file exists, read it in.
+    if networkFile:
+        networks = set([str(x).strip() for x in pd.read_csv(networkFile).network])
+        netCheck = metaDf.network.apply(lambda x: len(networks.intersection([y.strip() for y in str(x).split(',')])) > 0)
+        metaDf = metaDf[netCheck.values]
+    elif stnFile:
+        stationSub = pd.read_csv(stnFile)
+        metaDf = metaDf[metaDf.uniqueId.astype(str).isin(stationSub.uniqueID.astype(str)).values]
+    
+    # Ensure no duplicate unique IDs are present
+    metaDf = metaDf.drop_duplicates(subset='uniqueId')
+            
+    return metaDf
     
+def obsToArrays(resultObs,uniquesIn):
+    # Function to convert observation rows (unique ID, value, datetime) into
+    # typed arrays. Only rows with unique IDs found in uniquesIn are kept.
+    # Dates are returned as integer hours since EPOCH, truncated the same
+    # way as int(seconds/3600.0).
+    if len(resultObs) == 0:
+        return np.array([],dtype=np.int32), np.array([],dtype=np.float32), \
+               np.array([],dtype=np.int32)
+        
+    obsDf = pd.DataFrame([row[0:3] for row in resultObs],columns=['uniqueId','obs','date'])
+    obsDf = obsDf[obsDf.uniqueId.isin(uniquesIn).values]
+    
+    epoch = np.datetime64('1970-01-01T00:00:00','ns')
+    secondsOut = (pd.to_datetime(obsDf.date).values - epoch)/np.timedelta64(1,'s')
+    hoursOut = np.trunc(secondsOut/3600.0).astype(np.int32)
+    
+    return obsDf.uniqueId.values.astype(np.int32), obsDf.obs.values.astype(np.float32), hoursOut
+    
+def dailyAggregate(obsArrays):
+    # Function to aggregate typed observation arrays (unique ID, value, hours
+    # since EPOCH) to daily resolution. Days are UTC days, matching the 
+    # CalcDateTrunc truncation done in the R read scripts. Returned arrays are
+    # unique ID, daily mean, hours since EPOCH at 00Z of the day, count, min,
+    # and max, ordered by day, then unique ID.
+    uniqueIn, obsIn, hoursIn = obsArrays
+    if len(obsIn) == 0:
+        return np.array([],dtype=np.int32), np.array([],dtype=np.float32), \
+               np.array([],dtype=np.int32), np.array([],dtype=np.int32), \
+               np.array([],dtype=np.float32), np.array([],dtype=np.float32)
+               
+    obsDf = pd.DataFrame({'uniqueId':uniqueIn,'obs':obsIn.astype(np.float64),
+                          'day':np.floor_divide(hoursIn,24)})
+    dailyDf = obsDf.groupby(['day','uniqueId'],sort=True).obs.agg(['mean','count','min','max'])
+    dailyDf = dailyDf.reset_index()
+    
+    return dailyDf.uniqueId.values.astype(np.int32), dailyDf['mean'].values.astype(np.float32), \
+           (dailyDf.day.values*24).astype(np.int32), dailyDf['count'].values.astype(np.int32), \
+           dailyDf['min'].values.astype(np.float32), dailyDf['max'].values.astype(np.float32)
+    
+def rowsToArrays(rows,uniquesIn):
+    # Function to decode observation rows (unique ID, value, hours since 
+    # EPOCH), as pulled using buildObsCmd, into typed arrays. Rows are 
+    # converted in one pass, with no intermediate data frame or datetime 
+    # objects. Missing values become NaN. Only rows with unique IDs found
+    # in uniquesIn are kept.
+    if len(rows) == 0:
+        return np.array([],dtype=np.int32), np.array([],dtype=np.float32), \
+               np.array([],dtype=np.int32)
+               
+    buf = np.array(rows,dtype=np.float64)
+    keep = np.in1d(buf[:,0],uniquesIn)
+    
+    return buf[keep,0].astype(np.int32), buf[keep,1].astype(np.float32), \
+           buf[keep,2].astype(np.int32)
+    
+def snowObsStreamNC(fileOut,conn,cmdSWE,cmdSD,obsParams,resultMeta,chunkSize):
+    # Function to stream extracted snow observations into NetCDF file. Rows
+    # are pulled from a server-side cursor in chunks of chunkSize, and appended
+    # along unlimited observation dimensions. Peak memory is dictated by
+    # chunkSize, not the length of the extraction window.
+    
+    # First check to make sure output file doesn't already exist
+    if os.path.isfile(fileOut):
+        print "ERROR: Output Snow file: " + fileOut + " already exists"
+        raise
+        
+    # Meta data has already been subset on the server.
+    metaDf = subsetMeta(resultMeta,'','')
+    
+    # Create output NetCDF file.
+    idOut = Dataset(fileOut,'w')
+    
+    # Dimensions. Observation dimensions are unlimited so chunks can be 
+    # appended as they are pulled from the database.
+    metaDim1 = idOut.createDimension('numStations',len(metaDf.uniqueId))
+    sweDim1 = idOut.createDimension('numSweObs',None)
+    sdDim1 = idOut.createDimension('numSdObs',None)
+    
+    # Global attributes
+    idOut.institution = 'National Center for Atmospheric Research'
+    idOut.comment = 'Observations originally provided by the Office of Water Prediction'
+    # Streamed observations are never aggregated to daily means.
+    idOut.dailyAggregated = 0
+    
+    # Variables
+    chunkOut = min(chunkSize,65536)
+    obsIds = idOut.createVariable('ptUniqueIds','i4',('numStations'),zlib=True,complevel=2)
+    latVar = idOut.createVariable('ptLatitude','f4',('numStations'),zlib=True,complevel=2)
+    lonVar = idOut.createVariable('ptLongitude','f4',('numStations'),zlib=True,complevel=2)
+    sweObs = idOut.createVariable('sweObs','f4',('numSweObs'),zlib=True,complevel=2,chunksizes=(chunkOut,))
+    sweObs.units = 'mm'
+    sweObsIds = idOut.createVariable('sweObsIds','i4',('numSweObs'),zlib=True,complevel=2,chunksizes=(chunkOut,))
+    sweObsDates = idOut.createVariable('sweObsDates','i4',('numSweObs'),zlib=True,complevel=2,chunksizes=(chunkOut,))
+    sweObsDates.units = 'Hours since 1970-01-01 00:00:00'    
+    sdObs = idOut.createVariable('sdObs','f4',('numSdObs'),zlib=True,complevel=2,chunksizes=(chunkOut,))
+    sdObs.units = 'mm'
+    sdObsIds = idOut.createVariable('sdObsIds','i4',('numSdObs'),zlib=True,complevel=2,chunksizes=(chunkOut,))
+    sdObsDates = idOut.createVariable('sdObsDates','i4',('numSdObs'),zlib=True,complevel=2,chunksizes=(chunkOut,))
+    sdObsDates.units = 'Hours since 1970-01-01 00:00:00'
+    
+    # Place meta data into output file
+    obsIds[:] = metaDf.uniqueId.values
+    latVar[:] = metaDf.latitude.values
+    lonVar[:] = metaDf.longitude.values
+    
+    # Loop through SWE, then snow depth. Only one result set can be active on a 
+    # server-side cursor, so each must be fully consumed before moving on.
+    for cmd,valVar,idVar,dateVar in [(cmdSWE,sweObs,sweObsIds,sweObsDates),
+                                      (cmdSD,sdObs,sdObsIds,sdObsDates)]:
+        numObs = 0
+        try:
+            conn.execute(cmd,obsParams)
+        except:
+            print "ERROR: Unable to execute: " + cmd
+            idOut.close()
+            raise
+        while True:
+            rows = conn.fetchmany(chunkSize)
+            if len(rows) == 0:
+                break
+            idsChunk, valsChunk, datesChunk = rowsToArrays(rows,metaDf.uniqueId.values)
+            numRows = len(idsChunk)
+            if numRows == 0:
+                continue
+            valVar[numObs:numObs+numRows] = valsChunk
+            idVar[numObs:numObs+numRows] = idsChunk
+            dateVar[numObs:numObs+numRows] = datesChunk
+            numObs = numObs + numRows
+            print 'STREAMED ' + str(numObs) + ' OBSERVATIONS'
+        valVar.numObs = numObs
+        
+    if sweObs.numObs == 0:
+        print 'WARNING: 0 SWE Observations Extracted From Database.'
+    if sdObs.numObs == 0:
+        print 'WARNING: 0 SD Observations Extracted From Database.'
+    if sweObs.numObs == 0 and sdObs.numObs == 0:
+        print "ERROR: No observations extracted from database."
+        idOut.close()
+        os.remove(fileOut)
+        raise
+        
     # Close output file
     idOut.close()
     
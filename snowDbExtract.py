@@ -3,6 +3,18 @@
 # 1.) Extract all observations within a time period.
 # 2.) Extract all observations from subset of networks within a time period.
 # 3.) Extract specific observations within a time period (I.E. a list of stations)
+#
+# For long periods, passing --chunkSize will stream observations from the 
+# database in chunks, appending them to the output file as they arrive.
+# Passing --cacheDir will keep a local copy of observations pulled, so 
+# subsequent extractions only pull time periods not already cached.
+# Passing --nConn will split the period into time shards (--shardDays) and
+# pull them concurrently across a pool of database connections.
+# Passing --windows (or --waterYears) will extract one file per window in
+# a single invocation, sharing one connection pool and meta data pull, with
+# the NetCDF writes and R processing run across --nWorkers processes.
+# Passing --daily will aggregate hourly observations to daily means (along
+# with daily count/min/max) before they are written out.
 # 
 # In order to utilize the extraction properly, the user needs to either know
 # the network names, or unique ID values desired to extract. This can be done
@@ -31,6 +43,14 @@ def main(argv):
     parser.add_argument('--netList',nargs='?', help='List of Observation Networks for Reading')
     parser.add_argument('--stnList',nargs='?', help='List of Observation Stations for Reading')
     parser.add_argument('--mskFile',nargs='?', help='R mask file for cutouts of regions to process')
+    parser.add_argument('--chunkSize',nargs='?', help='Optional number of rows to stream from the database at a time. Bounds memory for long periods.')
+    parser.add_argument('--nConn',nargs='?', help='Optional number of concurrent database connections used to pull time shards in parallel.')
+    parser.add_argument('--shardDays',nargs='?', help='Optional length of parallel time shards in days. Default is 30.')
+    parser.add_argument('--cacheDir',nargs='?', help='Optional local observation cache directory. Only time periods not already cached are pulled from the database.')
+    parser.add_argument('--windows',nargs='?', help='Optional comma separated list of YYYYMMDDHH_YYYYMMDDHH windows to extract in one invocation.')
+    parser.add_argument('--waterYears',nargs='?', help='Optional range of water years in YYYY-YYYY format to extract, one file per water year.')
+    parser.add_argument('--nWorkers',nargs='?', help='Optional number of worker processes for writing/processing windows. Default is 1.')
+    parser.add_argument('--daily',nargs='?', help='Optional flag (1) to aggregate observations to daily mean/count/min/max before output.')
 
     args = parser.parse_args()
     
@@ -49,11 +69,67 @@ def main(argv):
             print "ERROR: Beginning analysis date must be less than ending date."
             sys.exit(1)
             
+    # Establish list of extraction windows for batch mode.
+    windows = []
+    if args.windows:
+        for windowStr in args.windows.split(','):
+            begStr, endStr = windowStr.strip().split('_')
+            begWinObj = pyHydroEvalUtils.returnDate(begStr)
+            endWinObj = pyHydroEvalUtils.returnDate(endStr)
+            if begWinObj >= endWinObj:
+                print "ERROR: Beginning window date must be less than ending date for: " + windowStr
+                sys.exit(1)
+            windows.append([begWinObj,endWinObj])
+    if args.waterYears:
+        begYr, endYr = [int(yrStr) for yrStr in args.waterYears.split('-')]
+        for yr in range(begYr,endYr+1):
+            windows.append([pyHydroEvalUtils.returnDate(str(yr-1) + '100100'),
+                            pyHydroEvalUtils.returnDate(str(yr) + '100100')])
+            
+    # Establish streaming chunk size. Zero means all rows are fetched at once.
+    chunkSize = 0
+    if args.chunkSize:
+        chunkSize = int(args.chunkSize)
+        
+    # Establish number of parallel connections and shard length.
+    nConn = 1
+    if args.nConn:
+        nConn = int(args.nConn)
+    shardDays = 30
+    if args.shardDays:
+        shardDays = int(args.shardDays)
+        
+    # Establish local observation cache directory, if requested.
+    cacheDir = ''
+    if args.cacheDir:
+        cacheDir = args.cacheDir
+            
+    # Establish number of worker processes for batch mode.
+    nWorkers = 1
+    if args.nWorkers:
+        nWorkers = int(args.nWorkers)
+        
+    # Establish daily aggregation flag.
+    dailyFlag = 0
+    if args.daily:
+        dailyFlag = int(args.daily)
+        
+    if len(windows) > 0:
+        print 'EXTRACTING SNOW OBSERVATIONS FOR ' + str(len(windows)) + ' WINDOWS'
+        snowDbMod.extractObsBatch(windows,args.outDir,args.geoFile,\
+                                  networkFile=args.netList,stnFile=args.stnList,\
+                                  maskFile=args.mskFile,nConn=nConn,\
+                                  shardDays=shardDays,nWorkers=nWorkers,\
+                                  dailyFlag=dailyFlag)
+        return
+            
     print 'EXTRACTING SNOW OBSERVATIONS'
     # If observations from Database needed, extract here
     snowDbMod.extractObs(begRDateObj,endRDateObj,args.outDir,args.geoFile,\
                          networkFile=args.netList,stnFile=args.stnList,\
-                         maskFile=args.mskFile)
+                         maskFile=args.mskFile,chunkSize=chunkSize,\
+                         cacheDir=cacheDir,nConn=nConn,shardDays=shardDays,\
+                         dailyFlag=dailyFlag)
     #try:
     #    snowDbMod.extractObs(begRDateObj,endRDateObj,args.outDir,args.geoFile,\
     #                         networkFile=args.netList,stnFile=args.stnList,\
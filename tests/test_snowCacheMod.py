@@ -0,0 +1,116 @@
+# Tests for the local snow observation cache (snowCacheMod). The snow
+# database server is stood in for by an in-memory SQLite database, which
+# the cache pulls from through the same fetchObs callback used with the
+# NWM snow database.
+
+import sys
+import os
+import shutil
+import tempfile
+import sqlite3
+import datetime
+import math
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','python'))
+
+import snowCacheMod
+
+class FakeServer:
+    # SQLite stand-in for the snow database server. Records each pull.
+    def __init__(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.execute("create table NWM_SWE (uniqueId integer, value real, obsDate text)")
+        self.pulls = []
+
+    def add(self,uniqueId,value,dateObj):
+        self.conn.execute("insert into NWM_SWE values (?,?,?)",
+                          (uniqueId,value,dateObj.strftime('%Y-%m-%d %H:%M:%S')))
+
+    def fetchObs(self,obsTable,loDateStr,hiDateStr):
+        # Yield rows in [loDateStr,hiDateStr), as done against the server.
+        self.pulls.append((loDateStr,hiDateStr))
+        cur = self.conn.execute("select uniqueId, value, obsDate from " + obsTable + \
+                                " where obsDate>=? and obsDate<? order by obsDate",
+                                (loDateStr,hiDateStr))
+        rows = [(row[0],row[1],datetime.datetime.strptime(row[2],'%Y-%m-%d %H:%M:%S'))
+                for row in cur.fetchall()]
+        if len(rows) != 0:
+            yield rows
+
+class TestSnowCache(unittest.TestCase):
+    def setUp(self):
+        self.cacheDir = tempfile.mkdtemp()
+        self.idxConn = snowCacheMod.openCache(self.cacheDir)
+        self.server = FakeServer()
+
+    def tearDown(self):
+        self.idxConn.close()
+        shutil.rmtree(self.cacheDir)
+
+    def getObs(self,begDateObj,endDateObj):
+        return snowCacheMod.getObs(self.cacheDir,self.idxConn,'NWM_SWE','',
+                                   begDateObj,endDateObj,self.server.fetchObs)
+
+    def testGapFill(self):
+        for day in range(1,29):
+            self.server.add(1,float(day),datetime.datetime(2020,2,day,12))
+        obs = self.getObs(datetime.datetime(2020,2,10),datetime.datetime(2020,2,20))
+        self.assertEqual(len(obs),10)
+        self.assertEqual(len(self.server.pulls),1)
+
+        # Only the ranges on either side of the cached range are pulled.
+        obs = self.getObs(datetime.datetime(2020,2,5),datetime.datetime(2020,2,25))
+        self.assertEqual(len(obs),20)
+        self.assertEqual(self.server.pulls[1:],
+                         [('2020-02-05 00:00:01','2020-02-10 00:00:01'),
+                          ('2020-02-20 00:00:00','2020-02-25 00:00:00')])
+
+        # Fully cached ranges are not pulled again.
+        obs = self.getObs(datetime.datetime(2020,2,6),datetime.datetime(2020,2,24))
+        self.assertEqual(len(obs),18)
+        self.assertEqual(len(self.server.pulls),3)
+
+    def testMonthPartitions(self):
+        self.server.add(1,1.0,datetime.datetime(2020,1,31,23))
+        self.server.add(2,2.0,datetime.datetime(2020,2,1,0))
+        self.server.add(1,3.0,datetime.datetime(2020,2,1,1))
+        obs = self.getObs(datetime.datetime(2020,1,31),datetime.datetime(2020,2,1,1))
+        self.assertTrue(os.path.isfile(self.cacheDir + '/SNOW_OBS_CACHE_202001.db'))
+        self.assertTrue(os.path.isfile(self.cacheDir + '/SNOW_OBS_CACHE_202002.db'))
+        # Observations at the window end are excluded, with rows across the
+        # month boundary returned in time order.
+        self.assertEqual([(row[0],row[1]) for row in obs],[(1,1.0),(2,2.0)])
+        obs = self.getObs(datetime.datetime(2020,1,31,23),datetime.datetime(2020,2,2))
+        self.assertEqual([(row[0],row[2]) for row in obs],
+                         [(2,'2020-02-01 00:00:00'),(1,'2020-02-01 01:00:00')])
+
+    def testRefreshLag(self):
+        nowObj = datetime.datetime.utcnow().replace(minute=0,second=0,microsecond=0)
+        begDateObj = nowObj - datetime.timedelta(days=10)
+        endDateObj = nowObj + datetime.timedelta(days=1)
+        self.server.add(1,1.0,nowObj - datetime.timedelta(days=5))
+        self.server.add(1,2.0,nowObj - datetime.timedelta(days=1))
+        obs = self.getObs(begDateObj,endDateObj)
+        self.assertEqual(len(obs),2)
+
+        # A late report and a revised report within the refresh lag are
+        # picked up by the next extraction, which only re-pulls the
+        # trailing window.
+        self.server.conn.execute("update NWM_SWE set value=5.0 where value=2.0")
+        self.server.add(2,3.0,nowObj - datetime.timedelta(hours=36))
+        obs = self.getObs(begDateObj,endDateObj)
+        self.assertEqual([row[1] for row in obs],[1.0,3.0,5.0])
+        loDateObj = datetime.datetime.strptime(self.server.pulls[-1][0],'%Y-%m-%d %H:%M:%S')
+        lagDateObj = nowObj - datetime.timedelta(days=snowCacheMod.refreshLagDays)
+        self.assertTrue(abs((loDateObj - lagDateObj).total_seconds()) < 3600)
+
+    def testMissingValues(self):
+        self.server.add(1,None,datetime.datetime(2020,3,1,12))
+        self.server.add(2,4.0,datetime.datetime(2020,3,1,12))
+        obs = self.getObs(datetime.datetime(2020,3,1),datetime.datetime(2020,3,2))
+        self.assertTrue(math.isnan(obs[0][1]))
+        self.assertEqual(obs[1][1],4.0)
+
+if __name__ == "__main__":
+    unittest.main()